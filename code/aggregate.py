@@ -0,0 +1,101 @@
+"""Tabular salary aggregation, run before any geometry is attached."""
+
+import numpy as np
+import pandas as pd
+
+GROUP_KEYS = ["years_experience", "education_class"]
+# Statistics `summarize` can compute. Weighted means use the district's
+# average daily attendance (tsal121.ts1_ada) or teacher FTE (ts1_totfte).
+STATISTICS = ("count", "mean", "median", "min", "max", "p25", "p75", "ada_weighted_mean", "fte_weighted_mean")
+QUANTILES = {"median": 0.5, "p25": 0.25, "p75": 0.75}
+WEIGHTS = {"ada_weighted_mean": "ts1_ada", "fte_weighted_mean": "ts1_totfte"}
+
+
+def rank_average_salary(df, by):
+    """Average `salary` per `by` group, ranked from highest (1) to lowest."""
+    avg = df["salary"].astype("float64").groupby(df[by], observed=True).mean().sort_values(ascending=False)
+    return pd.DataFrame({by: avg.index.astype(str), "salary": avg.to_numpy(), "salary_rank": np.arange(1, len(avg) + 1)})
+
+
+def summarize(teacher_salary, by, tsal121=None, statistics=STATISTICS):
+    """Compute `statistics` of salary for every (`by`, step, education class) in one sorted pass.
+
+    Rows are sorted once by group and salary; counts, sums and weighted sums
+    are segment reductions over that order, min/max/percentiles are read off
+    the sorted segments. Besides the requested statistics the summary keeps
+    the count, sum and weighted sums so groups can be combined afterwards
+    (see `rank_statistic`). `tsal121` supplies the weights for weighted means,
+    which are left out without it. Empty input gives an empty summary.
+    """
+    df = teacher_salary.dropna(subset=["salary", "education_class"])
+    keys = [by] + GROUP_KEYS
+    codes, uniques = zip(*(pd.factorize(df[key], sort=True) for key in keys))
+    group = np.ravel_multi_index(codes, [len(u) for u in uniques])
+    salary = df["salary"].to_numpy(dtype="float64")
+
+    order = np.lexsort((salary, group))
+    group, salary = group[order], salary[order]
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]]) if len(group) else np.array([], dtype=np.int64)
+    counts = np.diff(np.r_[starts, len(group)])
+    ends = starts + counts - 1
+
+    # Keys keep the dtype of their values (of the categories for categoricals), even with no rows
+    summary = pd.DataFrame({key: u.take(c).astype(getattr(u, "categories", u).dtype) for key, u, c in
+                            zip(keys, uniques, np.unravel_index(group[starts], [len(u) for u in uniques]))})
+    summary["education_class"] = summary["education_class"].astype(df["education_class"].dtype)
+    summary["count"] = counts
+    summary["sum"] = np.add.reduceat(salary, starts)
+    if "mean" in statistics:
+        summary["mean"] = summary["sum"] / counts
+    if "min" in statistics:
+        summary["min"] = salary[starts]
+    if "max" in statistics:
+        summary["max"] = salary[ends]
+    for name, q in QUANTILES.items():
+        if name in statistics:
+            # Linear interpolation between the closest ranks, as np.quantile does
+            position = starts + q * (counts - 1)
+            low = np.floor(position).astype(np.int64)
+            high = np.minimum(low + 1, ends)
+            summary[name] = salary[low] + (salary[high] - salary[low]) * (position - low)
+    for name, column in WEIGHTS.items():
+        if name in statistics and tsal121 is not None:
+            weights = df["cds"].astype(str).map(tsal121.set_index(tsal121["cds"].astype(str))[column]).fillna(0)
+            weights = weights.to_numpy(dtype="float64")[order]
+            prefix = name.replace("_weighted_mean", "")
+            summary[f"{prefix}_sum"] = np.add.reduceat(weights * salary, starts)
+            summary[f"{prefix}_weight"] = np.add.reduceat(weights, starts)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                summary[name] = summary[f"{prefix}_sum"] / summary[f"{prefix}_weight"]
+    return summary
+
+
+def rank_statistic(summary, by, step, classes, statistic="mean", groups=None):
+    """Rank `by` groups on one statistic of a `summarize` table for a step and set of education classes.
+
+    Returns the same columns as `rank_average_salary`, with the statistic in
+    `salary`. When several classes are selected their groups are combined,
+    which works for counts, means, min and max but not for percentiles.
+    `groups` optionally limits the ranking to those `by` values.
+    """
+    rows = summary[(summary["years_experience"] == step) & (summary["education_class"].isin(classes))]
+    if groups is not None:
+        rows = rows[rows[by].isin(groups)]
+    if statistic in QUANTILES and len(set(classes)) > 1:
+        raise ValueError(f"{statistic} cannot be combined across education classes")
+    grouped = rows.groupby(by, observed=True)
+    if statistic == "mean":
+        value = grouped["sum"].sum() / grouped["count"].sum()
+    elif statistic in WEIGHTS:
+        prefix = statistic.replace("_weighted_mean", "")
+        value = grouped[f"{prefix}_sum"].sum() / grouped[f"{prefix}_weight"].sum()
+    elif statistic == "count":
+        value = grouped["count"].sum()
+    elif statistic in ("min", "max"):
+        value = grouped[statistic].agg(statistic)
+    elif statistic in QUANTILES:
+        value = grouped[statistic].first()
+    else:
+        raise ValueError(f"Unknown statistic {statistic!r}")
+    value = value.astype("float64").sort_values(ascending=False)
+    return pd.DataFrame({by: value.index.astype(str), "salary": value.to_numpy(), "salary_rank": np.arange(1, len(value) + 1)})
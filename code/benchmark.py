@@ -0,0 +1,183 @@
+"""Benchmarks for every stage of the salary map pipeline.
+
+Times each stage and measures its peak Python/numpy allocation with
+tracemalloc, at the original size and on synthetically scaled copies of the
+salary tables (more districts and more years). Results are written as JSON and
+can be compared against a stored baseline:
+
+    python benchmark.py --scales 1 10 100 --years 1 3 --out bench.json
+    python benchmark.py --baseline bench.json
+"""
+
+import argparse
+import gc
+import json
+import platform
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+
+from aggregate import rank_average_salary, summarize
+from choropleth import assign_colors, class_breaks
+from education import BA_OR_MA, MA_OR_BA_UNITS, classify_columns, join_classes, normalize_descriptions
+from geometry import COUNTIES_SHP, DISTRICTS_SHP, clean_counties, clean_districts, load_layer, read_shapefile
+from ingest import DATA_DIR, parse_csv
+from maps import draw_map, salary_layer
+
+# Ratio over the baseline time that is reported as a regression
+REGRESSION_THRESHOLD = 1.2
+
+
+def measure(func, repeat=3):
+    """Return (result, best seconds, peak MB) of calling `func` `repeat` times."""
+    best = float("inf")
+    peak = 0
+    for _ in range(repeat):
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return result, best, peak / 2**20
+
+
+def scale_tables(tables, factor, years=1):
+    """Copy the CDE tables `factor` times over as new districts, and over `years` years.
+
+    Every copy, including the copy for each year, gets distinct cds codes (the
+    year and copy number are prefixed), so joins and groupbys on cds see
+    `factor * years` times the districts rather than duplicate keys fanning
+    out. The district geometry is repeated with the same codes.
+    """
+    if factor == 1 and years == 1:
+        return tables
+    scaled = {}
+    for name, df in tables.items():
+        copies = []
+        for year in range(years):
+            for i in range(factor):
+                copy = df.copy()
+                copy["cds"] = f"{year}{i:03d}" + copy["cds"].astype(str)
+                if years > 1:
+                    copy["year"] = 2021 - year
+                copies.append(copy)
+        scaled[name] = pd.concat(copies, ignore_index=True)
+        if isinstance(df, gpd.GeoDataFrame):
+            scaled[name] = gpd.GeoDataFrame(scaled[name], geometry=df.geometry.name, crs=df.crs)
+    return scaled
+
+
+def run_benchmarks(factor=1, years=1, repeat=3, data_dir=None, counties_path=COUNTIES_SHP, districts_path=DISTRICTS_SHP):
+    """Benchmark every stage at one scale; returns a list of result records."""
+    data_dir = Path(data_dir or DATA_DIR)
+    results = []
+
+    def record(stage, func, rows_in=None, rows_out=None):
+        result, seconds, peak_mb = measure(func, repeat)
+        if rows_out is None and hasattr(result, "__len__"):
+            rows_out = len(result)
+        results.append({"stage": stage, "scale": factor, "years": years, "seconds": seconds, "peak_mb": peak_mb,
+                        "rows_in": rows_in, "rows_out": rows_out})
+        return result
+
+    counties = record("shapefile_read_counties", lambda: read_shapefile(counties_path))
+    districts = record("shapefile_read_districts", lambda: read_shapefile(districts_path))
+    # Built once outside the timing, so this measures the cached columnar read
+    load_layer(districts_path, "district")
+    record("layer_load_districts", lambda: load_layer(districts_path, "district"))
+    raw = {name: record(f"csv_ingest_{name}", lambda name=name: parse_csv(name, data_dir / f"{name}.csv"))
+           for name in ("tsal121", "tsal221", "tsal321")}
+
+    tables = scale_tables({"tsal121": raw["tsal121"], "tsal221": raw["tsal221"], "tsal321": raw["tsal321"],
+                           "districts": clean_districts(districts)}, factor, years)
+    tsal221, tsal321 = tables["tsal221"], tables["tsal321"]
+    districts = tables["districts"]
+    counties = clean_counties(counties)
+
+    record("legacy_merge_tsal321_tsal221", lambda: tsal321.merge(
+        tsal221, how="left", left_on=["cds", "ts3_col"], right_on=["cds", "ts2_col"]), len(tsal321))
+    legacy = tsal321.merge(tsal221, how="left", left_on=["cds", "ts3_col"], right_on=["cds", "ts2_col"])
+    desc = legacy[["ts2_col1", "ts2_col1a", "ts2_col2"]].astype(object).fillna("nan").agg(' '.join, axis=1)
+    record("legacy_education_regex", lambda: desc[
+        desc.str.contains(r'ba\+\d+|^ma|\+ma| *ma', case=False) & ~desc.str.contains(r'ma\+| *ma\+', case=False)], len(desc))
+
+    record("normalize_descriptions", lambda: normalize_descriptions(tsal221), len(tsal221))
+    classes = record("classify_columns", lambda: classify_columns(tsal221), len(tsal221))
+    teacher_salary = record("merge_tsal321_classes", lambda: join_classes(tsal321, classes), len(tsal321))
+    first_year = record("education_class_filter", lambda: teacher_salary[
+        (teacher_salary["years_experience"] == 1) & teacher_salary["education_class"].isin(MA_OR_BA_UNITS)],
+        len(teacher_salary))
+
+    record("groupby_rank_average", lambda: rank_average_salary(first_year, "cds"), len(first_year))
+    record("summarize_all_statistics", lambda: summarize(teacher_salary, "cds", tables["tsal121"]),
+           len(teacher_salary))
+    county_avg = rank_average_salary(teacher_salary[(teacher_salary["years_experience"] == 1)
+                                                    & teacher_salary["education_class"].isin(BA_OR_MA)], "county")
+    district_avg = rank_average_salary(first_year, "cds")
+
+    record("county_geometry_merge", lambda: counties.merge(county_avg, how="left", left_on="COUNTY_NUM", right_on="county"),
+           len(county_avg))
+    record("district_geometry_merge", lambda: districts.merge(district_avg, how="left", on="cds"), len(district_avg))
+    layer, bins = salary_layer(district_avg, districts, "district")
+    record("color_assignment", lambda: assign_colors(layer["salary"], class_breaks(layer["salary"])), len(layer))
+    record("geojson_serialization", lambda: layer[["name", "salary", "fill_color", "geometry"]].to_json(), len(layer))
+    with tempfile.TemporaryDirectory() as tmp:
+        record("map_save", lambda: draw_map(layer, bins, "district", "Benchmark", "Benchmark", Path(tmp) / "map.html"),
+               len(layer), rows_out=len(layer))
+    return results
+
+
+def compare(results, baseline):
+    """Print each stage's time against the baseline and return the regressed stages."""
+    base = {(r["stage"], r["scale"], r["years"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        b = base.get((r["stage"], r["scale"], r["years"]))
+        if b is None:
+            continue
+        ratio = r["seconds"] / b["seconds"] if b["seconds"] else float("inf")
+        flag = ""
+        if ratio > REGRESSION_THRESHOLD:
+            flag = "  REGRESSION"
+            regressions.append(r)
+        print(f'{r["stage"]:<30} x{r["scale"]:<4} {r["years"]}y {b["seconds"]:9.4f}s -> {r["seconds"]:9.4f}s ({ratio:5.2f}x){flag}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the salary map pipeline.")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10], help="row multipliers to run at")
+    parser.add_argument("--years", nargs="+", type=int, default=[1], help="numbers of years to run at")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the fastest is reported")
+    parser.add_argument("--out", default="bench.json", help="where to write the results")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--counties", default=COUNTIES_SHP, help="county shapefile")
+    parser.add_argument("--districts", default=DISTRICTS_SHP, help="school district shapefile")
+    args = parser.parse_args(argv)
+
+    results = []
+    for years in args.years:
+        for factor in args.scales:
+            for r in run_benchmarks(factor, years, args.repeat, counties_path=args.counties, districts_path=args.districts):
+                print(f'{r["stage"]:<30} x{factor:<4} {years}y {r["seconds"]:9.4f}s {r["peak_mb"]:9.1f} MB')
+                results.append(r)
+    report = {"meta": {"python": platform.python_version(), "pandas": pd.__version__, "machine": platform.machine(),
+                       "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+              "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            raise SystemExit(f"{len(regressions)} stages regressed more than {REGRESSION_THRESHOLD:.0%} of baseline")
+
+
+if __name__ == "__main__":
+    main()
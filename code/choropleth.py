@@ -0,0 +1,179 @@
+"""Vectorized choropleth classification and color assignment."""
+
+import numpy as np
+from branca.element import MacroElement, Template
+
+PALETTE = np.array(['#fff7ec', '#fee8c8', '#fdd49e', '#fdbb84', '#fc8d59', '#ef6548', '#d7301f', '#990000'])
+MISSING_COLOR = '#d9d9d9'
+
+
+def class_breaks(values, k=len(PALETTE), scheme="equal_interval"):
+    """Return `k` ascending lower class edges for `values`, ignoring NaN.
+
+    `scheme` is one of "equal_interval", "quantile" or "jenks". The first edge
+    is the minimum and the last is the maximum, so the top class only holds
+    the maximum value, as in the original maps.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.zeros(k)
+    if scheme == "equal_interval":
+        return np.linspace(values.min(), values.max(), k)
+    if scheme == "quantile":
+        return np.quantile(values, np.linspace(0, 1, k))
+    if scheme == "jenks":
+        # Pinned in requirements.txt, but only this scheme needs it
+        import mapclassify
+        upper = mapclassify.NaturalBreaks(values, k=k - 1).bins
+        return np.concatenate([[values.min()], upper[:-1], [values.max()]])
+    raise ValueError(f"Unknown classification scheme {scheme!r}")
+
+
+def assign_colors(values, bins, palette=PALETTE, missing_color=MISSING_COLOR):
+    """Return the fill color for every value in one `np.digitize` pass; NaN gets `missing_color`."""
+    values = np.asarray(values, dtype=float)
+    idx = np.clip(np.digitize(values, bins) - 1, 0, len(palette) - 1)
+    return np.where(np.isnan(values), missing_color, np.asarray(palette)[idx])
+
+
+def legend_labels(bins, upper, palette=PALETTE):
+    """Return the legend `<li>` rows for each class range below `upper`."""
+    edges = list(bins[1:-1]) + [upper]
+    return "\n".join(
+        f"""    <li><span style='background:{color};opacity:0.9;'></span>{'${:,.2f}'.format(low)} - {'${:,.2f}'.format(high)}</li>"""
+        for color, low, high in zip(palette, bins, edges)
+    )
+
+
+def style_function(feature):
+    """GeoJson style that reads the precomputed `fill_color` property."""
+    return {'color': 'black',
+            'fillOpacity': .8,
+            'weight': 1,
+            'fillColor': feature['properties']['fill_color']}
+
+
+JQUERY_TAGS = """  <link rel="stylesheet" href="//code.jquery.com/ui/1.12.1/themes/base/jquery-ui.css">
+
+  <script src="https://code.jquery.com/jquery-1.12.4.js"></script>
+  <script src="https://code.jquery.com/ui/1.12.1/jquery-ui.js"></script>
+"""
+# Makes the legend draggable; shared by every map and bundled by `write_assets`
+LEGEND_JS = """  $( function() {
+    $( "#maplegend" ).draggable({
+                    start: function (event, ui) {
+                        $(this).css({
+                            right: "auto",
+                            top: "auto",
+                            bottom: "auto"
+                        });
+                    }
+                });
+});
+"""
+LEGEND_CSS = """  .maplegend .legend-title {
+    text-align: left;
+    margin-bottom: 5px;
+    font-weight: bold;
+    font-size: 90%;
+    }
+  .maplegend .legend-scale ul {
+    margin: 0;
+    margin-bottom: 5px;
+    padding: 0;
+    float: left;
+    list-style: none;
+    }
+  .maplegend .legend-scale ul li {
+    font-size: 80%;
+    list-style: none;
+    margin-left: 0;
+    line-height: 18px;
+    margin-bottom: 2px;
+    }
+  .maplegend ul.legend-labels li span {
+    display: block;
+    float: left;
+    height: 16px;
+    width: 30px;
+    margin-right: 5px;
+    margin-left: 0;
+    border: 1px solid #999;
+    }
+  .maplegend .legend-source {
+    font-size: 80%;
+    color: #777;
+    clear: both;
+    }
+  .maplegend a {
+    color: #777;
+    }
+"""
+
+
+def legend_macro(title, bins, upper, missing_label=None, palette=PALETTE, assets=None):
+    """Return the draggable legend element for a choropleth with class edges `bins`.
+
+    `missing_label` adds a row for the missing color above the class ranges.
+    `assets` maps "css" and "js" to the URLs of the shared legend stylesheet
+    and script (see `maps.write_assets`); without it both are inlined.
+    """
+    missing = ""
+    if missing_label:
+        missing = f"""  <li><span style='background:{MISSING_COLOR};opacity:0.8;'></span>{missing_label}</li>\n"""
+    legend = """<div id='maplegend' class='maplegend' 
+    style='position: absolute; z-index:9999; border:2px solid grey; background-color:rgba(255, 255, 255, 0.8);
+     border-radius:6px; padding: 10px; font-size:14px; right: 20px; bottom: 20px;'>
+     
+<div class='legend-title'>""" + title + """</div>
+<div class='legend-scale'>
+  <ul class='legend-labels', style="font-weight: bold;">
+""" + missing + legend_labels(bins, upper, palette) + """
+
+  </ul>
+</div>
+</div>"""
+    if assets is not None:
+        template = """
+{% macro header(this, kwargs) %}
+""" + JQUERY_TAGS + """  <link rel="stylesheet" href='""" + assets["css"] + """'>
+  <script src='""" + assets["js"] + """'></script>
+{% endmacro %}
+
+{% macro html(this, kwargs) %}
+""" + legend + """
+{% endmacro %}"""
+        macro = MacroElement()
+        macro._template = Template(template)
+        return macro
+
+    template = """
+{% macro html(this, kwargs) %}
+
+<!doctype html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <title>jQuery UI Draggable - Default functionality</title>
+""" + JQUERY_TAGS + """  
+  <script>
+""" + LEGEND_JS + """
+  </script>
+</head>
+<body>
+
+ 
+""" + legend + """
+ 
+</body>
+</html>
+
+<style type='text/css'>
+""" + LEGEND_CSS + """</style>
+{% endmacro %}"""
+
+    macro = MacroElement()
+    macro._template = Template(template)
+    return macro
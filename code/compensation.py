@@ -0,0 +1,184 @@
+"""Total compensation and per-day pay for every district salary cell.
+
+tsal121 reports, per district, the employer's annual health benefit cap for
+single, two-party and family coverage (`ts1_maxsin`, `ts1_maxtwo`,
+`ts1_maxfam`), the annual master's and doctorate stipends (`ts1_mbonam`,
+`ts1_dbonam`) and the number of work days (`ts1_ndays`). `compensation_view`
+joins them onto every (cds, step, column) of the salary schedule in one
+vectorized pass:
+
+- stipend: the master's stipend on MA and MA+units columns, the doctorate
+  stipend on doctorate columns, nothing elsewhere.
+- total_single, total_two, total_family: salary plus stipend plus the benefit
+  cap for that coverage.
+- daily_pay: salary plus stipend over the work days.
+
+The other bonuses (`ts1_o1bona` to `ts1_o4bona`, special education, bilingual,
+...) depend on the assignment rather than the schedule and are summed into
+`other_bonuses` without entering the totals.
+
+Every measure is also scattered into a SalaryCube next to the salary cube, so
+`load_compensation("total_family").at(step, column)` answers a query with no
+computation. `build_map` ranks districts or counties on a measure through the
+stage cache like `pipeline.build_map` does on salary:
+
+    python compensation.py --measure total_family --level district --out total_compensation.html
+"""
+
+import argparse
+import inspect
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import pipeline
+import quality
+from education import MA_OR_BA_UNITS, join_classes, load_education_classes
+from geometry import COUNTIES_SHP, DISTRICTS_SHP
+from ingest import DATA_DIR, file_hash, fingerprint, load_table
+from salary_cube import SalaryCube, build_cube, cube_directory, load_cube
+
+# ts1_type codes, in order
+DISTRICT_TYPES = ["County Office of Education", "Elementary", "High School", "Common Admin District", "Unified"]
+COVERAGES = {"single": "ts1_maxsin", "two": "ts1_maxtwo", "family": "ts1_maxfam"}
+STIPENDS = {"MA": "ts1_mbonam", "MA_UNITS": "ts1_mbonam", "DOCTORATE": "ts1_dbonam"}
+OTHER_BONUSES = ["ts1_o1bona", "ts1_o2bona", "ts1_o3bona", "ts1_o4bona", "ts1_sebona", "ts1_bbonam",
+                 "ts1_cbonam", "ts1_bcbona", "ts1_nbonam"]
+MEASURES = tuple(f"total_{coverage}" for coverage in COVERAGES) + ("daily_pay",)
+MEASURE_LABELS = {
+    "total_single": "Total Compensation (Single Coverage)",
+    "total_two": "Total Compensation (Two-Party Coverage)",
+    "total_family": "Total Compensation (Family Coverage)",
+    "daily_pay": "Daily Pay",
+}
+
+
+def decode_district_types(ts1_type):
+    """ts1_type codes as a categorical of DISTRICT_TYPES; unknown codes are NaN."""
+    codes = pd.to_numeric(pd.Series(ts1_type), errors="coerce").to_numpy()
+    valid = (codes >= 0) & (codes < len(DISTRICT_TYPES))
+    return pd.Categorical.from_codes(np.where(valid, codes, -1).astype(np.int8), categories=DISTRICT_TYPES)
+
+
+def _district_values(tsal121, cds, columns):
+    """`columns` of tsal121 aligned with `cds`, as float64 with missing values 0."""
+    values = tsal121[[col for col in columns if col in tsal121.columns]].apply(pd.to_numeric, errors="coerce")
+    values.index = tsal121["cds"].astype(str)
+    values = values[~values.index.duplicated()].reindex(columns=columns)
+    return values.reindex(cds).fillna(0).to_numpy(dtype=np.float64)
+
+
+def compensation_view(teacher_salary, tsal121):
+    """Salaries joined to their district's benefits and stipends, one row per teacher_salary row."""
+    cds = teacher_salary["cds"].astype(str).to_numpy()
+    benefits = _district_values(tsal121, cds, list(COVERAGES.values()))
+    stipend_columns = sorted(set(STIPENDS.values()))
+    stipends = _district_values(tsal121, cds, stipend_columns)
+    other = _district_values(tsal121, cds, OTHER_BONUSES).sum(axis=1)
+    days = _district_values(tsal121, cds, ["ts1_ndays"])[:, 0]
+    types = tsal121.set_index(tsal121["cds"].astype(str))["ts1_type"]
+
+    education_class = teacher_salary["education_class"].astype(str).to_numpy()
+    stipend = np.zeros(len(cds))
+    for cls, column in STIPENDS.items():
+        rows = education_class == cls
+        stipend[rows] = stipends[rows, stipend_columns.index(column)]
+    pay = teacher_salary["salary"].to_numpy(dtype=np.float64) + stipend
+
+    view = teacher_salary[["county", "cds", "years_experience", "education_level_column", "education_class",
+                           "salary"]].copy()
+    view["district_type"] = decode_district_types(types[~types.index.duplicated()].reindex(cds).to_numpy())
+    view["stipend"] = stipend
+    for (coverage, _), cap in zip(COVERAGES.items(), benefits.T):
+        view[f"total_{coverage}"] = pay + cap
+    with np.errstate(invalid="ignore", divide="ignore"):
+        view["daily_pay"] = np.where(days > 0, pay / days, np.nan)
+    view["other_bonuses"] = other
+    return view
+
+
+def _measure_salaries(view, measure):
+    # The teacher_salary layout with the measure as the salary, so `summarize` ranks on it
+    return view[["county", "cds", "years_experience", "education_level_column", "education_class"]].assign(
+        salary=view[measure].to_numpy())
+
+
+def view_stage(prepared):
+    """The compensation view of `pipeline.load_prepared` output, through the stage cache."""
+    return pipeline.run_stage("compensation", compensation_view, [prepared["teacher_salary"], prepared["tsal121"]],
+                              code=[sys.modules[__name__], inspect.getmodule(join_classes)])
+
+
+def measure_summary(prepared, level, measure):
+    """`pipeline.summary` of one compensation measure, so `rank_statistic` ranks on it like on salary."""
+    salaries = pipeline.run_stage(f"compensation-{measure}", _measure_salaries, [view_stage(prepared)],
+                                  params={"measure": measure})
+    return pipeline.summary(salaries, prepared["tsal121"], level)
+
+
+def build_map(prepared, level, measure, step, classes, title, legend_title, out_path, statistic="mean",
+              static=False):
+    """`pipeline.build_map` ranking counties or districts on a compensation measure instead of salary."""
+    summary = measure_summary(prepared, level, measure)
+    return pipeline.build_map({**prepared, f"summary-{level}": summary}, level, step, classes, title, legend_title,
+                              out_path, statistic, static)
+
+
+def build_compensation(tsal121, education_classes, tsal321):
+    """{measure: SalaryCube} of every measure, on the districts, steps and columns of the salary cube."""
+    excluded = quality.excluded_cds(quality.duplicate_keys(tsal321))
+    view = compensation_view(join_classes(tsal321, education_classes, excluded), tsal121)
+    cells = view.rename(columns={"years_experience": "ts3_step", "education_level_column": "ts3_col"})
+    return {measure: build_cube(cells.assign(ts3_salary=cells[measure].astype(np.float32))) for measure in MEASURES}
+
+
+def load_compensation(measure, data_dir=None, cache_dir=None):
+    """Return the memory-mapped cube of one measure, stored next to the salary cube and built if needed."""
+    data_dir = Path(data_dir or DATA_DIR)
+    cube_dir = cube_directory(data_dir, cache_dir)
+    # The stipends depend on the classifier as much as on this module's code
+    key = fingerprint(file_hash(data_dir / "tsal121.csv"), file_hash(data_dir / "tsal221.csv"),
+                      sys.modules[__name__], inspect.getmodule(join_classes), quality.duplicate_keys)
+    directory = cube_dir / f"compensation-{key[:16]}"
+    if not (directory / measure / "salary_cube.json").exists():
+        load_cube(data_dir, cache_dir)
+        cubes = build_compensation(load_table("tsal121", data_dir, cache_dir),
+                                   load_education_classes(data_dir, cache_dir),
+                                   load_table("tsal321", data_dir, cache_dir))
+        # Each measure is moved into place on its own, so a directory missing
+        # only some measures (e.g. after MEASURES grew) is filled in
+        for name, cube in cubes.items():
+            target = directory / name
+            if (target / "salary_cube.json").exists():
+                continue
+            tmp = target.with_suffix(".tmp")
+            shutil.rmtree(tmp, ignore_errors=True)
+            cube.save(tmp)
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(tmp, target)
+    return SalaryCube.load(directory / measure)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Map districts or counties ranked on total compensation.")
+    parser.add_argument("--measure", choices=MEASURES, default="total_family")
+    parser.add_argument("--level", choices=["county", "district"], default="district")
+    parser.add_argument("--step", type=int, default=1, help="salary step")
+    parser.add_argument("--out", default="ca_teacher_total_compensation.html", help="HTML file to write")
+    parser.add_argument("--counties", default=COUNTIES_SHP, help="county shapefile")
+    parser.add_argument("--districts", default=DISTRICTS_SHP, help="school district shapefile")
+    args = parser.parse_args(argv)
+    prepared = pipeline.load_prepared(args.counties, args.districts)
+    label = MEASURE_LABELS[args.measure]
+    where = "County" if args.level == "county" else "School District"
+    build_map(prepared, args.level, args.measure, args.step, MA_OR_BA_UNITS,
+              f'Average {label} by {where} for a Step {args.step} Teacher with a Masters (or Bachelors with significant units)',
+              f'Avg. {label} by {where}', args.out)
+
+
+if __name__ == "__main__":
+    main()
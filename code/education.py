@@ -0,0 +1,113 @@
+"""Education level classification of the tsal221 column descriptions.
+
+Each J-90 schedule column is described in free text (`ts2_col1`, `ts2_col1a`,
+`ts2_col2`), e.g. "BA+45 OR MA" or "EMERG/ INTERN". Every distinct description
+is parsed once into structured features, and the result is cached as one row
+per (cds, ts2_col) with a categorical `education_class`, so filtering salary
+rows by education level is a comparison of category codes.
+"""
+
+import re
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from ingest import CACHE_DIR, DATA_DIR, cache_path, file_hash, fingerprint, load_table, read_arrow, write_arrow
+
+EDUCATION_CLASSES = ["OTHER", "BA", "BA_UNITS", "MA", "MA_UNITS", "DOCTORATE"]
+EDUCATION_LABELS = {
+    "OTHER": "Other Education Level",
+    "BA": "Bachelors",
+    "BA_UNITS": "Bachelors with Units",
+    "MA": "Masters",
+    "MA_UNITS": "Masters with Units",
+    "DOCTORATE": "Doctorate",
+}
+CREDENTIALS = ["NONE", "EMERG", "INTERN", "PRELIM", "CLEAR", "NON_CRED", "CRED"]
+
+# Any BA or MA column, and the "Masters (or Bachelors with significant units)"
+# columns used for the district map. MA+units columns are left out of the
+# latter since they describe a teacher past an entry level masters. Unlike the
+# original notebook filter, "MA+CRED" or "BA+60+MA+CLAD" count as MA: only a
+# number after "MA+" makes an MA+units column.
+BA_OR_MA = ["BA", "BA_UNITS", "MA", "MA_UNITS"]
+MA_OR_BA_UNITS = ["BA_UNITS", "MA"]
+
+DOCTORATE_RE = re.compile(r"\b(?:PHD|PH\.D|EDD|ED\.D|DOCTORATE)\b")
+MA_UNITS_RE = re.compile(r"(?<![A-Z])MA\s*\+\s*\d")
+MA_RE = re.compile(r"(?<![A-Z])(?:MA|MASTERS?)(?![A-Z])")
+BA_UNITS_RE = re.compile(r"(?<![A-Z])BA\s*\+\s*\d")
+BA_RE = re.compile(r"(?<![A-Z])(?:BA|BACHELORS?)(?![A-Z])")
+UNITS_RE = re.compile(r"\+\s*(\d+)")
+CREDENTIAL_RES = [
+    ("EMERG", re.compile(r"\bEMERG?\b")),
+    ("INTERN", re.compile(r"\bINTERN")),
+    ("PRELIM", re.compile(r"\bPRELIM")),
+    ("CLEAR", re.compile(r"\bCLEAR")),
+    ("NON_CRED", re.compile(r"\bNON[- ]?CRED")),
+    ("CRED", re.compile(r"CRED")),
+]
+
+
+def normalize_descriptions(tsal221):
+    """Join the description columns into one upper case, whitespace collapsed string per row."""
+    parts = tsal221[["ts2_col1", "ts2_col1a", "ts2_col2"]].fillna("").astype(str)
+    joined = parts["ts2_col1"] + " " + parts["ts2_col1a"] + " " + parts["ts2_col2"]
+    return joined.str.upper().str.split().str.join(" ")
+
+
+def parse_description(desc):
+    """Parse one normalized description into (education_class, units, credential)."""
+    # Highest degree first: "BA+75+MA+PHD" and "MA OR PHD" are doctorate columns
+    if DOCTORATE_RE.search(desc):
+        education_class = "DOCTORATE"
+    elif MA_UNITS_RE.search(desc):
+        education_class = "MA_UNITS"
+    elif MA_RE.search(desc):
+        education_class = "MA"
+    elif BA_UNITS_RE.search(desc):
+        education_class = "BA_UNITS"
+    elif BA_RE.search(desc):
+        education_class = "BA"
+    else:
+        education_class = "OTHER"
+    units = max((int(n) for n in UNITS_RE.findall(desc)), default=0)
+    credential = next((name for name, pattern in CREDENTIAL_RES if pattern.search(desc)), "NONE")
+    return education_class, units, credential
+
+
+def classify_columns(tsal221):
+    """Return one classified row per (cds, ts2_col) of tsal221."""
+    desc = normalize_descriptions(tsal221).astype("category")
+    # Parse each distinct description once, then broadcast by category code
+    parsed = pd.DataFrame([parse_description(d) for d in desc.cat.categories],
+                          columns=["education_class", "units", "credential"])
+    codes = desc.cat.codes.to_numpy()
+    return pd.DataFrame({
+        "cds": tsal221["cds"].to_numpy(),
+        "ts2_col": tsal221["ts2_col"].to_numpy(),
+        "education_level_desc": desc.to_numpy(),
+        "education_class": pd.Categorical(parsed["education_class"].to_numpy()[codes], categories=EDUCATION_CLASSES),
+        "units": parsed["units"].to_numpy(dtype="int16")[codes],
+        "credential": pd.Categorical(parsed["credential"].to_numpy()[codes], categories=CREDENTIALS),
+    })
+
+
+def join_classes(tsal321, education_classes, excluded=()):
+    """Salary rows of tsal321 with the education class of their column, leaving out `excluded` districts."""
+    teacher_salary = tsal321[~tsal321["cds"].isin(excluded)].merge(
+        education_classes, how="left", left_on=["cds", "ts3_col"], right_on=["cds", "ts2_col"])
+    return teacher_salary[["county", "cds", "ts3_step", "ts3_col", "education_class", "ts3_salary"]].rename(
+        columns={"ts3_step": "years_experience", "ts3_col": "education_level_column", "ts3_salary": "salary"})
+
+
+def load_education_classes(data_dir=None, cache_dir=None):
+    """Return `classify_columns` for the current tsal221, cached by the tsal221 cache and this module's code."""
+    table = cache_path("tsal221", file_hash(Path(data_dir or DATA_DIR) / "tsal221.csv")).name
+    # The whole module, since the patterns the classifier uses are module constants
+    key = fingerprint(table, sys.modules[__name__])
+    path = Path(cache_dir or CACHE_DIR) / f"education-{key[:16]}.arrow"
+    if not path.exists():
+        write_arrow(classify_columns(load_table("tsal221", data_dir, cache_dir)), path)
+    return read_arrow(path).to_pandas()
@@ -0,0 +1,238 @@
+"""One interactive district map for every experience step and education class.
+
+Rather than one HTML file per (step, education class), the explorer embeds the
+salary cube in the page as base64 typed arrays and recolors the districts in
+the browser when a step or education class is picked from the dropdowns. The
+district geometry ships once.
+
+Each district's block of the cube is trimmed to the steps and columns it
+actually uses and stored as whole cents in a Uint32Array, next to the
+education class of each of its columns, so the payload is about four bytes per
+tsal321 row. For a step and set of classes the page averages the district's
+salaries in those columns, as `aggregate.rank_average_salary` does, and
+classifies them with equal intervals like `choropleth.class_breaks`.
+
+Run `python explorer.py --out ca_teacher_salary_explorer.html`.
+"""
+
+import argparse
+import base64
+import json
+
+import folium
+import numpy as np
+import pandas as pd
+from branca.element import MacroElement, Template
+
+from choropleth import MISSING_COLOR, PALETTE, assign_colors, class_breaks, legend_macro, style_function
+from education import BA_OR_MA, EDUCATION_CLASSES, EDUCATION_LABELS, MA_OR_BA_UNITS, load_education_classes
+from geometry import DISTRICTS_SHP, load_layer
+from maps import MAP_CENTER, TOOLTIP_STYLE
+from salary_cube import load_cube
+
+# Dropdown choices beyond the single education classes, as in the notebook maps
+CLASS_CHOICES = [("Masters or Bachelors with Units", MA_OR_BA_UNITS), ("Bachelors or Masters", BA_OR_MA)] + [
+    (EDUCATION_LABELS[cls], [cls]) for cls in EDUCATION_CLASSES]
+LEGEND_TITLE = 'Avg. Salary by School District'
+
+
+def column_classes(cube, education_classes):
+    """Education class code (1-based into EDUCATION_CLASSES, 0 if unknown) of every cube (district, column)."""
+    codes = np.zeros((len(cube.cds), len(cube.columns)), dtype=np.uint8)
+    classes = education_classes.dropna(subset=["education_class"])
+    i = cube.cds.get_indexer(classes["cds"].astype(str))
+    c = classes["ts2_col"].to_numpy(dtype=np.int64) - cube.column_start
+    valid = (i >= 0) & (c >= 0) & (c < codes.shape[1])
+    class_codes = pd.Categorical(classes["education_class"].astype(str), categories=EDUCATION_CLASSES).codes + 1
+    codes[i[valid], c[valid]] = class_codes[valid]
+    return codes
+
+
+def class_means(cube, codes, step, classes):
+    """Average salary per cube district over its columns in `classes` at `step`; NaN where there are none."""
+    s = step - cube.step_start
+    if not 0 <= s < cube.values.shape[1]:
+        return np.full(len(cube.cds), np.nan)
+    values = np.asarray(cube.values[:, s, :], dtype=np.float64)
+    selected = np.isin(codes, [EDUCATION_CLASSES.index(cls) + 1 for cls in classes]) & ~np.isnan(values)
+    with np.errstate(invalid="ignore"):
+        return np.where(selected, values, 0).sum(axis=1) / selected.sum(axis=1)
+
+
+def _b64(array, dtype):
+    # Typed arrays use the platform byte order, which is little-endian everywhere browsers run
+    return base64.b64encode(np.ascontiguousarray(array, dtype=dtype).tobytes()).decode()
+
+
+def _used(present):
+    """Length of each row of a (district, n) mask up to and including its last True."""
+    return np.where(present.any(axis=1), present.shape[1] - present[:, ::-1].argmax(axis=1), 0)
+
+
+def pack_cube(cube, codes):
+    """Trim every district's block of the cube to its used steps and columns and base64 encode it."""
+    present = ~np.isnan(np.asarray(cube.values))
+    used_steps, used_columns = _used(present.any(axis=2)), _used(present.any(axis=1))
+    salaries, classes = [], []
+    for d, (n_steps, n_columns) in enumerate(zip(used_steps, used_columns)):
+        block = np.asarray(cube.values[d, :n_steps, :n_columns], dtype=np.float64)
+        salaries.append(np.where(np.isnan(block), 0, np.round(block * 100)).astype(np.uint32).ravel())
+        classes.append(codes[d, :n_columns])
+    return {
+        "step_start": cube.step_start,
+        "salaries": _b64(np.concatenate(salaries) if salaries else [], "<u4"),
+        "offsets": _b64(np.r_[0, np.cumsum([len(block) for block in salaries])], "<u4"),
+        "steps": _b64(used_steps, np.uint8),
+        "columns": _b64(used_columns, np.uint8),
+        "classes": _b64(np.concatenate(classes) if classes else [], np.uint8),
+    }
+
+
+def explorer_macro(layer, title_id, packed, steps, step, choice):
+    """Return the element holding the packed cube, the dropdowns and the recoloring script."""
+    options = {"steps": [int(s) for s in steps], "step": int(step), "choice": choice,
+               "choices": [[label, [EDUCATION_CLASSES.index(cls) + 1 for cls in classes]]
+                           for label, classes in CLASS_CHOICES],
+               "palette": list(PALETTE), "missing_color": MISSING_COLOR, "title_id": title_id}
+    template = """
+{% macro script(this, kwargs) %}
+(function() {
+    var map = {{ this._parent.get_name() }};
+    var layer = """ + layer.get_name() + """;
+    var cube = """ + json.dumps(packed) + """;
+    var options = """ + json.dumps(options) + """;
+
+    function decode(b64, Type) {
+        var bin = atob(b64), bytes = new Uint8Array(bin.length);
+        for (var i = 0; i < bin.length; i++) { bytes[i] = bin.charCodeAt(i); }
+        return new Type(bytes.buffer);
+    }
+    var salaries = decode(cube.salaries, Uint32Array), offsets = decode(cube.offsets, Uint32Array);
+    var steps = decode(cube.steps, Uint8Array), columns = decode(cube.columns, Uint8Array);
+    var classes = decode(cube.classes, Uint8Array), classOffsets = new Uint32Array(columns.length + 1);
+    for (var d = 0; d < columns.length; d++) { classOffsets[d + 1] = classOffsets[d] + columns[d]; }
+
+    function average(d, step, codes) {
+        var s = step - cube.step_start;
+        if (d < 0 || s < 0 || s >= steps[d]) { return NaN; }
+        var sum = 0, n = 0, base = offsets[d] + s * columns[d];
+        for (var c = 0; c < columns[d]; c++) {
+            var cents = salaries[base + c];
+            if (cents > 0 && codes.indexOf(classes[classOffsets[d] + c]) >= 0) { sum += cents; n++; }
+        }
+        return n ? sum / n / 100 : NaN;
+    }
+    function money(v) {
+        return '$' + v.toLocaleString('en-US', {minimumFractionDigits: 2, maximumFractionDigits: 2});
+    }
+
+    layer.options.style = function(feature) {
+        return {color: 'black', fillOpacity: 0.8, weight: 1, fillColor: feature.properties.fill_color};
+    };
+
+    function recolor(step, choice) {
+        var codes = options.choices[choice][1], layers = layer.getLayers(), values = [];
+        var lo = Infinity, hi = -Infinity;
+        layers.forEach(function(l) {
+            var v = average(l.feature.properties.i, step, codes);
+            values.push(v);
+            if (!isNaN(v)) { lo = Math.min(lo, v); hi = Math.max(hi, v); }
+        });
+        var k = options.palette.length, bins = [];
+        for (var b = 0; b < k; b++) {
+            bins.push(lo === Infinity ? 0 : Math.round((lo + (hi - lo) * b / (k - 1)) * 100) / 100);
+        }
+        layers.forEach(function(l, j) {
+            var v = values[j], idx = 0;
+            while (idx < k && bins[idx] <= v) { idx++; }
+            l.feature.properties.fill_color = isNaN(v) ? options.missing_color : options.palette[Math.min(Math.max(idx - 1, 0), k - 1)];
+            l.feature.properties.salary = isNaN(v) ? 0 : v;
+            l.feature.properties.salary_formated = money(isNaN(v) ? 0 : v);
+            layer.resetStyle(l);
+        });
+        var upper = Math.max(0, hi), rows = ["<li><span style='background:" + options.missing_color +
+            ";opacity:0.8;'></span>Missing data represented as $ 0</li>"];
+        for (var r = 0; r < k - 1; r++) {
+            var high = r < k - 2 ? bins[r + 1] : upper;
+            rows.push("<li><span style='background:" + options.palette[r] + ";opacity:0.9;'></span>" +
+                      money(bins[r]) + " - " + money(high) + "</li>");
+        }
+        var legend = document.querySelector('#maplegend ul.legend-labels');
+        if (legend) { legend.innerHTML = rows.join(''); }
+        document.getElementById(options.title_id).innerHTML = '<b>Average District Salary for a Step ' + step +
+            ' Teacher (' + options.choices[choice][0] + ')</b>';
+    }
+
+    var control = L.control({position: 'topright'});
+    control.onAdd = function() {
+        var div = L.DomUtil.create('div', 'leaflet-bar');
+        div.style.background = 'white';
+        div.style.padding = '6px';
+        var stepSelect = L.DomUtil.create('select', '', div), classSelect = L.DomUtil.create('select', '', div);
+        options.steps.forEach(function(s) { stepSelect.add(new Option('Step ' + s, s, false, s === options.step)); });
+        options.choices.forEach(function(c, j) { classSelect.add(new Option(c[0], j, false, j === options.choice)); });
+        function update() { recolor(parseInt(stepSelect.value), parseInt(classSelect.value)); }
+        stepSelect.onchange = update;
+        classSelect.onchange = update;
+        L.DomEvent.disableClickPropagation(div);
+        L.DomEvent.disableScrollPropagation(div);
+        return div;
+    };
+    control.addTo(map);
+})();
+{% endmacro %}
+"""
+    macro = MacroElement()
+    macro._template = Template(template)
+    return macro
+
+
+def build_explorer(cube, education_classes, districts, path, step=1, classes=MA_OR_BA_UNITS):
+    """Write the interactive district map to `path`, initially showing `step` and `classes`."""
+    codes = column_classes(cube, education_classes)
+    choice = next(j for j, (_, choice_classes) in enumerate(CLASS_CHOICES) if choice_classes == list(classes))
+    layer = districts[["cds", "DistrictNa", "geometry"]].copy()
+    layer["i"] = cube.cds.get_indexer(layer["cds"].astype(str))
+    layer["name"] = layer["DistrictNa"] + " School District"
+    means = class_means(cube, codes, step, classes)
+    layer["salary"] = np.where(layer["i"] >= 0, means[layer["i"]], np.nan)
+    bins = class_breaks(layer["salary"]).round(2)
+    layer["fill_color"] = assign_colors(layer["salary"], bins)
+    layer["salary"] = layer["salary"].fillna(0)
+    layer["salary_formated"] = layer["salary"].map('${:,.2f}'.format)
+
+    title_id = "explorer-title"
+    label = CLASS_CHOICES[choice][0]
+    m = folium.Map(location=MAP_CENTER["district"], zoom_start=6)
+    geojson = folium.GeoJson(
+        data=layer[["name", "i", "salary", "salary_formated", "fill_color", "geometry"]],
+        style_function=style_function,
+        highlight_function=lambda x: {'fillColor': '#000000', 'color': '#000000', 'fillOpacity': 0.50, 'weight': 0.1},
+        name="Teacher Salaries",
+        smooth_factor=None,
+        zoom_on_click=True,
+        tooltip=folium.features.GeoJsonTooltip(fields=['name', "salary_formated"], aliases=['Name:', "Avg. Salary:"],
+                                               style=TOOLTIP_STYLE),
+    ).add_to(m)
+    m.get_root().html.add_child(folium.Element(
+        f'<h3 id="{title_id}" align="center" style="font-size:16px">'
+        f'<b>Average District Salary for a Step {step} Teacher ({label})</b></h3>'))
+    m.get_root().add_child(legend_macro(LEGEND_TITLE, bins, layer['salary'].max(),
+                                        missing_label='Missing data represented as $ 0'))
+    present = ~np.isnan(np.asarray(cube.values)).all(axis=(0, 2))
+    m.add_child(explorer_macro(geojson, title_id, pack_cube(cube, codes), cube.steps[present], step, choice))
+    m.save(str(path))
+    return m
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the single interactive district salary map.")
+    parser.add_argument("--out", default="ca_teacher_salary_explorer.html", help="HTML file to write")
+    parser.add_argument("--districts", default=DISTRICTS_SHP, help="school district shapefile")
+    args = parser.parse_args(argv)
+    districts = load_layer(args.districts, "district")
+    build_explorer(load_cube(), load_education_classes(), districts, args.out)
+
+
+if __name__ == "__main__":
+    main()
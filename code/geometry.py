@@ -0,0 +1,133 @@
+"""Multi-resolution geometry preparation for the county and district maps.
+
+Shapefiles are read through pyogrio's Arrow interface rather than feature by
+feature. Each shapefile is simplified once per zoom level with
+topology-preserving simplification (shared borders are simplified as one arc,
+so neighbouring polygons never gap or overlap), reprojected to WGS84, its
+coordinates are quantized, and the result is cached as GeoParquet keyed by the
+hash of the shapefile, the zoom's tolerance and the simplification code. The maps embed the simplified layers as GeoJSON, since
+folium's TopoJson layer has no highlight or zoom-on-click; static output
+(`maps.save_static`) bounds their coordinate precision instead.
+
+`load_layer` goes one step further for the maps: the county or district layer
+is also cleaned once (islands dropped, county numbers padded, `CDCode` renamed
+to `cds`) and cached as GeoParquet with a bbox covering column, so later loads
+are a single columnar read that can skip rows outside a bounding box.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import geopandas as gpd
+import pyogrio
+import shapely
+import topojson
+
+from ingest import CACHE_DIR, DATA_DIR, file_hash, fingerprint
+
+COUNTIES_SHP = DATA_DIR / "ca_counties" / "cnty19_1.shp"
+DISTRICTS_SHP = DATA_DIR / "ca_school_districts" / "California_School_District_Areas_2020-21.shp"
+
+# Simplification tolerance in meters per zoom level, about half a screen
+# pixel at that zoom
+LEVELS = {6: 1000, 9: 150, 12: 20}
+# Simplification happens in California Albers so tolerances are in meters
+CA_ALBERS = "EPSG:3310"
+WGS84 = "EPSG:4326"
+# Number of grid steps across the layer's extent that coordinates snap to
+QUANTIZATION = 1e5
+SHAPEFILE_PARTS = (".shp", ".shx", ".dbf", ".prj")
+
+
+def shapefile_hash(path):
+    """Return a sha256 hex digest over all parts of a shapefile."""
+    path = Path(path)
+    digest = hashlib.sha256()
+    for suffix in SHAPEFILE_PARTS:
+        part = path.with_suffix(suffix)
+        if part.exists():
+            digest.update(file_hash(part).encode())
+    return digest.hexdigest()
+
+
+def read_shapefile(path):
+    """Read a shapefile in one vectorized pass through pyogrio's Arrow interface."""
+    return pyogrio.read_dataframe(path, use_arrow=True)
+
+
+def simplify_layer(gdf, tolerance, quantization=QUANTIZATION):
+    """Return `gdf` in WGS84, simplified by `tolerance` meters along shared arcs and quantized."""
+    topo = topojson.Topology(gdf.to_crs(CA_ALBERS), prequantize=False, toposimplify=tolerance)
+    simplified = topo.to_gdf(crs=CA_ALBERS).to_crs(WGS84)
+    minx, miny, maxx, maxy = simplified.total_bounds
+    grid = max(maxx - minx, maxy - miny) / quantization
+    simplified.geometry = shapely.set_precision(simplified.geometry.values, grid)
+    return simplified[gdf.columns]
+
+
+def simplified_paths(shapefile, levels=LEVELS, cache_dir=None):
+    """{zoom: cache path} of the simplified layers, keyed on everything that shapes them."""
+    shapefile = Path(shapefile)
+    source_hash = shapefile_hash(shapefile)
+    paths = {}
+    for zoom, tolerance in levels.items():
+        key = fingerprint(source_hash, tolerance, QUANTIZATION, CA_ALBERS, WGS84, read_shapefile, simplify_layer)
+        paths[zoom] = Path(cache_dir or CACHE_DIR) / "geometry" / f"{shapefile.stem}-{key[:16]}-z{zoom}.parquet"
+    return paths
+
+
+def prepare_geometry(shapefile, levels=LEVELS, cache_dir=None):
+    """Build the cached simplified layers for every zoom level; return {zoom: parquet path}."""
+    paths = simplified_paths(shapefile, levels, cache_dir)
+    missing = [zoom for zoom, path in paths.items() if not path.exists()]
+    if missing:
+        full = read_shapefile(shapefile)
+        for zoom in missing:
+            paths[zoom].parent.mkdir(parents=True, exist_ok=True)
+            tmp = paths[zoom].with_suffix(".tmp")
+            simplify_layer(full, levels[zoom]).to_parquet(tmp)
+            os.replace(tmp, paths[zoom])
+    return paths
+
+
+def read_simplified(shapefile, zoom=9, cache_dir=None):
+    """Return the shapefile simplified for `zoom`, building the cache if the shapefile changed."""
+    return gpd.read_parquet(prepare_geometry(shapefile, cache_dir=cache_dir)[zoom])
+
+
+def clean_counties(counties):
+    # Exclude Island portions off the mainland USA and pad county numbers to match the CDE tables
+    counties = counties[counties["ISLAND"].isnull()]
+    counties["COUNTY_NUM"] = counties["COUNTY_NUM"].astype(str).str.rjust(2, '0')
+    return counties[["COUNTY_NAM", "COUNTY_NUM", "geometry"]]
+
+
+def clean_districts(districts):
+    return districts.rename(columns={"CDCode": "cds"})[["cds", "DistrictNa", "geometry"]]
+
+
+CLEANERS = {"county": clean_counties, "district": clean_districts}
+
+
+def layer_path(shapefile, level, zoom=9, cache_dir=None):
+    """Cache path of a cleaned layer, keyed on its simplified layer and the cleaner's code."""
+    simplified = simplified_paths(shapefile, {zoom: LEVELS[zoom]}, cache_dir)[zoom]
+    key = fingerprint(simplified.name, CLEANERS[level])
+    return simplified.parent / f"{Path(shapefile).stem}-{key[:16]}-z{zoom}-{level}.parquet"
+
+
+def load_layer(shapefile, level, zoom=9, bbox=None, cache_dir=None):
+    """Return the cleaned WGS84 county or district layer simplified for `zoom`.
+
+    The layer is built once per shapefile version and cleaner, and read
+    back with a single GeoParquet read; `bbox` (minx, miny, maxx, maxy in
+    WGS84) reads only the features that intersect it.
+    """
+    path = layer_path(shapefile, level, zoom, cache_dir)
+    if not path.exists():
+        layer = CLEANERS[level](read_simplified(shapefile, zoom, cache_dir))
+        tmp = path.with_suffix(".tmp")
+        layer.to_parquet(tmp, write_covering_bbox=True)
+        os.replace(tmp, path)
+    return gpd.read_parquet(path, bbox=bbox)
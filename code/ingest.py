@@ -0,0 +1,119 @@
+"""Typed ingest of the CDE J-90 salary tables with an Arrow cache.
+
+Each table is parsed from CSV once with explicit dtypes and written to an
+uncompressed Arrow IPC file keyed by the hash of the source CSV and a
+`fingerprint` of the parsing code and dtypes. Later runs memory-map that file
+instead of re-parsing the CSV.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+# Source data lives in the repo `data` directory unless overridden
+DATA_DIR = Path(os.environ.get("CA_SALARY_DATA", Path(__file__).resolve().parent.parent / "data"))
+CACHE_DIR = Path(os.environ.get("CA_SALARY_CACHE", DATA_DIR / "cache"))
+
+# Explicit dtypes per table. Identifier columns are read as strings first so
+# their leading zeros survive, then stored as categoricals.
+CATEGORY_COLUMNS = {
+    "tsal121": ["county", "district", "cds", "ts1_county"],
+    "tsal221": ["county", "district", "cds"],
+    "tsal321": ["county", "district", "cds"],
+}
+DTYPES = {
+    "tsal121": {"ts1_type": "int8", "ts1_ada": "float32", "ts1_totfte": "float32", "ts1_ndays": "int16"},
+    "tsal221": {"ts2_col": "int16", "ts2_col1": str, "ts2_col1a": str, "ts2_col2": str,
+                "ts2_col3": str, "ts2_col3a": str},
+    "tsal321": {"ts3_step": "int16", "ts3_col": "int16", "ts3_salary": "float32"},
+}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Return the sha256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(*parts):
+    """Hex digest of what a cached file was built from, for its cache key.
+
+    Functions, classes and modules contribute their source code, anything
+    else its JSON (or str) form, so editing the code or changing a parameter
+    gives a new key instead of serving a stale file.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if inspect.isfunction(part) or inspect.isclass(part) or inspect.ismodule(part):
+            text = inspect.getsource(part)
+        else:
+            text = json.dumps(part, sort_keys=True, default=str)
+        digest.update(text.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def declared_name(name):
+    """Name the dtypes of table `name` are declared under; other years share the 2020-21 ones."""
+    return name if name in DTYPES else f"{name[:5]}21"
+
+
+def csv_dtypes(name):
+    """`read_csv` dtypes for table `name`, identifiers as strings."""
+    dtype = {col: str for col in CATEGORY_COLUMNS.get(declared_name(name), [])}
+    dtype.update(DTYPES.get(declared_name(name), {}))
+    return dtype
+
+
+def parse_csv(name, path):
+    """Parse one CDE table from CSV with the dtypes declared for it."""
+    categories = CATEGORY_COLUMNS.get(declared_name(name), [])
+    df = pd.read_csv(path, dtype=csv_dtypes(name))
+    for col in categories:
+        df[col] = df[col].astype("category")
+    return df
+
+
+def cache_path(name, source_hash, cache_dir=None):
+    """Arrow cache of table `name`, keyed on its source hash and the code and dtypes that parse it."""
+    key = fingerprint(source_hash, parse_csv, csv_dtypes, declared_name, CATEGORY_COLUMNS, DTYPES)
+    return Path(cache_dir or CACHE_DIR) / f"{name}-{key[:16]}.arrow"
+
+
+def write_arrow(df, path):
+    """Write a DataFrame to an uncompressed Arrow IPC file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Write to a temporary file first so a crashed run never leaves a partial cache
+    tmp = path.with_suffix(".tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def read_arrow(path):
+    """Memory-map an Arrow IPC file written by `write_arrow`."""
+    return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+
+def load_arrow(name, data_dir=None, cache_dir=None):
+    """Return table `name` as a memory-mapped Arrow table, building the cache if needed."""
+    source = Path(data_dir or DATA_DIR) / f"{name}.csv"
+    path = cache_path(name, file_hash(source), cache_dir)
+    if not path.exists():
+        write_arrow(parse_csv(name, source), path)
+    return read_arrow(path)
+
+
+def load_table(name, data_dir=None, cache_dir=None):
+    """Return table `name` as a typed DataFrame backed by the Arrow cache."""
+    return load_arrow(name, data_dir, cache_dir).to_pandas(split_blocks=True)
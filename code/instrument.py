@@ -0,0 +1,151 @@
+"""Opt-in instrumentation of the pipeline stages.
+
+Disabled by default, in which case the pipeline never calls into this module.
+Once `enable()` is called each stage records its wall and CPU time, rows in and
+out, the memory used by its output and its peak Python allocation (tracemalloc,
+which also tracks numpy buffers). With `profiler="cprofile"` or
+`"pyinstrument"` every stage is also profiled and the profile of the slowest
+one is kept. `write_report` saves the records as JSON next to that profile and
+`summary` formats them as a table.
+"""
+
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+ENABLED = False
+PROFILER = None
+RECORDS = []
+
+# (seconds, stage name, profiler) of the slowest profiled stage so far
+_slowest = None
+
+
+def enable(profiler=None):
+    """Start recording stages; `profiler` is None, "cprofile" or "pyinstrument"."""
+    global ENABLED, PROFILER, _slowest
+    if profiler not in (None, "cprofile", "pyinstrument"):
+        raise ValueError(f"unknown profiler {profiler!r}")
+    if profiler == "pyinstrument":
+        import pyinstrument  # noqa: F401 -- fail now rather than inside the first stage
+    ENABLED, PROFILER, _slowest = True, profiler, None
+    RECORDS.clear()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def rows(value):
+    """Row count of a frame, or None for anything else."""
+    return len(value) if isinstance(value, (pd.DataFrame, pd.Series)) else None
+
+
+def memory_bytes(value):
+    """Memory used by a frame, or the size of a file stage output."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (str, os.PathLike)) and os.path.isfile(value):
+        return os.path.getsize(value)
+    return None
+
+
+class StageRecord(dict):
+    def set_output(self, value, status=None):
+        self["rows_out"] = rows(value)
+        self["output_bytes"] = memory_bytes(value)
+        if status is not None:
+            self["status"] = status
+
+
+def _start_profiler():
+    if PROFILER == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+    return profiler
+
+
+def _stop_profiler(profiler):
+    if PROFILER == "cprofile":
+        profiler.disable()
+    else:
+        profiler.stop()
+
+
+@contextmanager
+def stage(name, inputs=()):
+    """Record one stage; the yielded StageRecord takes the stage output via `set_output`."""
+    global _slowest
+    record = StageRecord(stage=name, status=None, rows_in=sum(rows(value) or 0 for value in inputs))
+    tracemalloc.reset_peak()
+    traced_before = tracemalloc.get_traced_memory()[0]
+    profiler = _start_profiler() if PROFILER else None
+    cpu, wall = time.process_time(), time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["wall_seconds"] = time.perf_counter() - wall
+        record["cpu_seconds"] = time.process_time() - cpu
+        if profiler is not None:
+            _stop_profiler(profiler)
+            if _slowest is None or record["wall_seconds"] > _slowest[0]:
+                _slowest = (record["wall_seconds"], name, profiler)
+        record["peak_alloc_bytes"] = tracemalloc.get_traced_memory()[1] - traced_before
+        RECORDS.append(record)
+
+
+def write_report(path):
+    """Write the stage records to `path` as JSON, and the slowest stage's profile beside it."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    report = {"stages": RECORDS,
+              "total": {"wall_seconds": sum(r["wall_seconds"] for r in RECORDS),
+                        "cpu_seconds": sum(r["cpu_seconds"] for r in RECORDS),
+                        "peak_alloc_bytes": max((r["peak_alloc_bytes"] for r in RECORDS), default=0)}}
+    if _slowest is not None:
+        _, name, profiler = _slowest
+        if PROFILER == "cprofile":
+            profile_path = path.with_suffix(".prof")
+            profiler.dump_stats(profile_path)
+        else:
+            profile_path = path.with_suffix(".html")
+            profile_path.write_text(profiler.output_html())
+        report["profile"] = {"stage": name, "profiler": PROFILER, "path": str(profile_path)}
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def _mb(n):
+    return "" if n is None else f"{n / 2**20:.1f}"
+
+
+def summary():
+    """The stage records as a human-readable table, slowest first."""
+    width = max([len(r["stage"]) for r in RECORDS] + [5])
+    lines = [f"{'stage':<{width}} {'status':<7} {'wall s':>8} {'cpu s':>8} {'rows in':>10} {'rows out':>10} "
+             f"{'out MB':>8} {'peak MB':>8}"]
+    for r in sorted(RECORDS, key=lambda r: r["wall_seconds"], reverse=True):
+        lines.append(f"{r['stage']:<{width}} {r['status'] or '':<7} {r['wall_seconds']:8.2f} {r['cpu_seconds']:8.2f} "
+                     f"{r['rows_in']:>10} {r['rows_out'] if r['rows_out'] is not None else '':>10} "
+                     f"{_mb(r['output_bytes']):>8} {_mb(r['peak_alloc_bytes']):>8}")
+    if _slowest is not None:
+        lines.append(f"profiled slowest stage: {_slowest[1]}")
+    return "\n".join(lines)
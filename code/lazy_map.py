@@ -0,0 +1,165 @@
+"""District map that loads district geometry one county at a time.
+
+The page embeds only the county layer, colored by the county average on the
+district classes so the two layers share one legend. District polygons are
+written per county to `districts/<county number>.json`, with precompressed
+`.gz` and `.br` siblings, and fetched when a county is clicked (which also
+zooms to it, as in the other maps) or when the map is zoomed in to
+`DISTRICT_ZOOM` over it. Zooming back out hides the districts again, except
+those of the counties that were clicked.
+
+The output is a directory meant for a static host; browsers will not fetch the
+county files from a page opened with file://.
+
+    python lazy_map.py --out-dir site/district
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+from branca.element import MacroElement, Template
+
+import maps
+import parallel
+import pipeline
+from choropleth import assign_colors
+from education import MA_OR_BA_UNITS
+from geometry import COUNTIES_SHP, DISTRICTS_SHP
+
+# Zoom level from which the districts of the counties in view are shown
+DISTRICT_ZOOM = 8
+DISTRICT_FIELDS = ["name", "salary_formated", "fill_color", "geometry"]
+
+
+def county_layer(avg_salary, geometry, bins):
+    """County polygons colored by their average salary on the district map's class breaks."""
+    layer = geometry.merge(avg_salary, how='inner', left_on='COUNTY_NUM', right_on="county")
+    layer["name"] = layer["COUNTY_NAM"] + " County"
+    layer["fill_color"] = assign_colors(layer["salary"], bins)
+    layer["salary_formated"] = layer["salary"].map('${:,.2f}'.format)
+    return layer
+
+
+def _write_county(districts, out_dir):
+    # The first two digits of a CDS code are the county number
+    path = Path(out_dir) / f"{districts['cds'].astype(str).iloc[0][:2]}.json"
+    path.write_text(districts[DISTRICT_FIELDS].to_json(drop_id=True, separators=(",", ":")))
+    maps.precompress(path)
+    return path
+
+
+def write_district_files(district_layer, out_dir, workers=None):
+    """Write the districts of every county to `<out_dir>/<county number>.json` plus compressed copies.
+
+    Counties are serialized and compressed on `workers` processes (see parallel.py).
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    layer = district_layer[["cds"] + DISTRICT_FIELDS]
+    partitions = parallel.partition_rows(layer, [layer["cds"].astype(str).str[:2]])
+    return parallel.map_partitions(_write_county, layer, partitions.values(), workers, out_dir=str(out_dir))
+
+
+def lazy_districts_macro(county_geojson, url):
+    """Return the element that fetches `<url>/<county number>.json` for clicked or zoomed-in counties."""
+    template = """
+{% macro script(this, kwargs) %}
+(function() {
+    var map = {{ this._parent.get_name() }};
+    var counties = """ + county_geojson.get_name() + """;
+    // One district layer per county, once fetched, and the counties clicked
+    var layers = {};
+    var pinned = {};
+    function districtLayer() {
+        var layer = L.geoJson(null, {
+            style: function(feature) {
+                return {color: 'black', fillOpacity: 0.8, weight: 1, fillColor: feature.properties.fill_color};
+            },
+            onEachFeature: function(feature, district) {
+                district.bindTooltip('<b>Name:</b> ' + feature.properties.name +
+                                     '<br><b>Avg. Salary:</b> ' + feature.properties.salary_formated,
+                                     {className: 'foliumtooltip', sticky: true});
+                district.on({
+                    mouseover: function(e) {
+                        e.target.setStyle({fillColor: '#000000', color: '#000000', fillOpacity: 0.50, weight: 0.1});
+                    },
+                    mouseout: function(e) { layer.resetStyle(e.target); }
+                });
+            }
+        });
+        return layer;
+    }
+    function show(county) {
+        if (!layers[county]) {
+            var layer = layers[county] = districtLayer();
+            fetch('""" + url + """/' + county + '.json')
+                .then(function(response) { return response.json(); })
+                .then(function(data) { layer.addData(data); })
+                .catch(function() { map.removeLayer(layer); delete layers[county]; });
+        }
+        layers[county].addTo(map);
+    }
+    function update() {
+        // Clicked counties stay shown at any zoom: the click's zoom to the
+        // county can end below the district zoom on small screens
+        var zoomed = map.getZoom() >= """ + str(DISTRICT_ZOOM) + """;
+        var bounds = map.getBounds();
+        counties.eachLayer(function(layer) {
+            var county = layer.feature.properties.COUNTY_NUM;
+            if (pinned[county] || (zoomed && bounds.intersects(layer.getBounds()))) {
+                show(county);
+            } else if (layers[county]) {
+                map.removeLayer(layers[county]);
+            }
+        });
+    }
+    counties.eachLayer(function(layer) {
+        var county = layer.feature.properties.COUNTY_NUM;
+        layer.on('click', function() { pinned[county] = true; show(county); });
+    });
+    map.on('zoomend moveend', update);
+})();
+{% endmacro %}
+"""
+    macro = MacroElement()
+    macro._template = Template(template)
+    return macro
+
+
+def build_lazy_map(prepared, step, classes, title, legend_title, out_dir, statistic="mean", workers=None):
+    """Write `index.html` and the per-county district files for one step and set of classes to `out_dir`."""
+    out_dir = Path(out_dir)
+    district_avg = pipeline.aggregate(prepared["summary-district"], prepared["district"], "district",
+                                      step, classes, statistic).value
+    county_avg = pipeline.aggregate(prepared["summary-county"], prepared["county"], "county",
+                                    step, classes, statistic).value
+    districts, bins = maps.salary_layer(district_avg, prepared["district"].value, "district")
+    counties = county_layer(county_avg, prepared["county"].value, bins)
+    write_district_files(districts, out_dir / "districts", workers)
+
+    m, county_geojson = maps.salary_map(counties, bins, "district", title, legend_title,
+                                        legend_upper=districts["salary"].max(), properties=["COUNTY_NUM"])
+    m.add_child(lazy_districts_macro(county_geojson, "districts"))
+    path = out_dir / "index.html"
+    m.save(str(path))
+    maps.precompress(path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the district map with per-county district geometry.")
+    parser.add_argument("--out-dir", default="district_map", help="directory the page and district files go to")
+    parser.add_argument("--counties", default=COUNTIES_SHP, help="county shapefile")
+    parser.add_argument("--districts", default=DISTRICTS_SHP, help="school district shapefile")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    args = parser.parse_args(argv)
+    pipeline.WORKERS = args.workers
+    prepared = pipeline.load_prepared(args.counties, args.districts)
+    build_lazy_map(prepared, 1, MA_OR_BA_UNITS,
+                   'Average District Salary for a 1st Year Teacher with a Masters (or Bachelors with significant units)',
+                   'Avg. Salary for BA/MA Teachers by School District', args.out_dir, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
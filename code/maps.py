@@ -0,0 +1,165 @@
+"""Folium map drawing shared by the batch renderer and the staged build."""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+import brotli
+import folium
+import numpy as np
+from folium.plugins import Geocoder, MeasureControl
+
+from choropleth import LEGEND_CSS, LEGEND_JS, assign_colors, class_breaks, legend_macro, style_function
+from tiles import vector_tile_layer
+
+TOOLTIP_STYLE = """
+        background-color: #F0EFEF;
+        border: 2px solid black;
+        border-radius: 2px,
+        box-shadow: 3px; 
+        """
+MAP_CENTER = {"county": [37.411292, -118], "district": [37.5, -117]}
+LAYER_KEYS = {"county": "COUNTY_NUM", "district": "cds"}
+
+# Static output: the legend stylesheet and script every map shares, named by
+# content so hosts can cache them indefinitely, and the coordinate precision
+# of embedded geometry (5 decimal degrees is about a meter)
+ASSET_CONTENT = {"css": LEGEND_CSS, "js": LEGEND_JS}
+ASSETS = {kind: f"assets/salary-maps-{hashlib.sha256(content.encode()).hexdigest()[:12]}.{kind}"
+          for kind, content in ASSET_CONTENT.items()}
+COORDINATE_DIGITS = 5
+GEOJSON_CALL = re.compile(r"\w+_add\((?=\{)")
+
+
+def salary_layer(avg_salary, geometry, level):
+    """Join ranked average salaries onto county or district geometry and color them."""
+    if level == "county":
+        layer = geometry.merge(avg_salary, how='inner', left_on='COUNTY_NUM', right_on="county")
+        layer["name"] = layer["COUNTY_NAM"] + " County"
+        bins = class_breaks(layer["salary"])
+    else:
+        layer = geometry.merge(avg_salary, how='left', on="cds")
+        layer["name"] = layer["DistrictNa"] + " School District"
+        bins = class_breaks(layer["salary"]).round(2)
+    layer["fill_color"] = assign_colors(layer["salary"], bins)
+    # Missing district salaries are represented as $0
+    layer["salary"] = layer["salary"].fillna(0)
+    layer["salary_formated"] = layer["salary"].map('${:,.2f}'.format)
+    return layer, bins
+
+
+def tile_properties(layer, level):
+    """Feature properties of a colored salary layer for its vector tiles, with the layer's key column."""
+    properties = layer[[LAYER_KEYS[level], "name", "salary", "salary_rank", "fill_color"]].copy()
+    properties["feature_id"] = np.arange(len(properties))
+    properties["salary_rank"] = properties["salary_rank"].fillna(0).astype(int)
+    properties["tooltip"] = "<b>Name:</b> " + layer["name"] + "<br><b>Avg. Salary:</b> " + layer["salary_formated"]
+    return properties
+
+
+def salary_map(layer, bins, level, title, legend_title, legend_upper=None, properties=(), assets=None,
+               tiles_url=None):
+    """Return a folium map of a colored salary layer with its legend and title, and the layer's element.
+
+    `legend_upper` is the top of the legend, the layer's highest salary by
+    default. `properties` are extra layer columns kept on the features.
+    `assets` links the legend stylesheet and script instead of inlining them.
+    `tiles_url` draws the layer from a vector tile pyramid written from
+    `tile_properties` (see tiles.py) instead of embedding it as GeoJSON.
+    """
+    m = folium.Map(location=MAP_CENTER[level], zoom_start=6)
+    if tiles_url is not None:
+        geojson = vector_tile_layer(tiles_url, level)
+        m.add_child(geojson)
+    else:
+        geojson = folium.GeoJson(
+            data=layer[["name", "salary", "salary_rank", "salary_formated", "fill_color", *properties, "geometry"]],
+            style_function=style_function,
+            highlight_function=lambda x: {'fillColor': '#000000', 'color': '#000000', 'fillOpacity': 0.50,
+                                          'weight': 0.1},
+            name=title,
+            smooth_factor=None,
+            zoom_on_click=True,
+            tooltip=folium.features.GeoJsonTooltip(fields=['name', "salary_formated"],
+                                                   aliases=['Name:', "Avg. Salary:"], style=TOOLTIP_STYLE),
+        ).add_to(m)
+    missing_label = 'Missing data represented as $ 0' if level == "district" else None
+    upper = layer['salary'].max() if legend_upper is None else legend_upper
+    m.get_root().html.add_child(folium.Element(f'<h3 align="center" style="font-size:16px"><b>{title}</b></h3>'))
+    m.get_root().add_child(legend_macro(legend_title, bins, upper, missing_label=missing_label, assets=assets))
+    m.add_child(MeasureControl(position='bottomleft', primary_length_unit='miles', secondary_length_unit='meters',
+                               primary_area_unit='sqmiles', secondary_area_unit=np.nan))
+    Geocoder().add_to(m)
+    return m, geojson
+
+
+def draw_map(layer, bins, level, title, legend_title, path, static=False, tiles_url=None):
+    """Draw a colored salary layer with its legend and title and save it to `path`.
+
+    `static` saves it with `save_static`, linking the shared assets in `ASSETS`.
+    `tiles_url` is passed to `salary_map`.
+    """
+    m, _ = salary_map(layer, bins, level, title, legend_title, assets=ASSETS if static else None,
+                      tiles_url=tiles_url)
+    if static:
+        save_static(m, path)
+    else:
+        m.save(str(path))
+    return m
+
+
+def _round_coordinates(coordinates, digits):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(c, digits) for c in coordinates]
+    return [_round_coordinates(c, digits) for c in coordinates]
+
+
+def compact_geojson(html, digits=COORDINATE_DIGITS):
+    """Rewrite the GeoJSON embedded by folium layers without whitespace and with `digits` decimal coordinates."""
+    decoder = json.JSONDecoder()
+    parts, pos = [], 0
+    for match in GEOJSON_CALL.finditer(html):
+        if match.start() < pos:
+            continue
+        data, end = decoder.raw_decode(html, match.end())
+        for feature in data.get("features", []):
+            geometry = feature.get("geometry") or {}
+            if "coordinates" in geometry:
+                geometry["coordinates"] = _round_coordinates(geometry["coordinates"], digits)
+        if "bbox" in data:
+            data["bbox"] = _round_coordinates(data["bbox"], digits)
+        text = json.dumps(data, separators=(",", ":"))
+        # Keep the JSON safe to embed in a <script>, as folium's tojson does
+        text = text.replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026").replace("'", "\\u0027")
+        parts += [html[pos:match.end()], text]
+        pos = end
+    parts.append(html[pos:])
+    return "".join(parts)
+
+
+def save_static(m, path):
+    """Save a map for static hosting: compact bounded-precision geometry, assets linked from `ASSETS`."""
+    Path(path).write_text(compact_geojson(m.get_root().render()), encoding="utf-8")
+
+
+def write_assets(out_dir):
+    """Write the shared assets in `ASSETS` under `out_dir`, with precompressed copies; existing files are kept."""
+    for kind, url in ASSETS.items():
+        path = Path(out_dir) / url
+        if path.exists():
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(ASSET_CONTENT[kind])
+        os.replace(tmp, path)
+        precompress(path)
+
+
+def precompress(path):
+    """Write `.gz` and `.br` siblings of `path` for static hosts to serve."""
+    data = Path(path).read_bytes()
+    Path(f"{path}.gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    Path(f"{path}.br").write_bytes(brotli.compress(data))
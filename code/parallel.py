@@ -0,0 +1,192 @@
+"""Multi-core execution of the table stages, partitioned by county and year.
+
+No salary group spans two counties (or two school years), so the classify,
+join and summarize stages can run on every county separately and their
+results be stacked afterwards. `map_partitions` does that on a process pool:
+the input frame is shared with the workers copy-on-write where processes are
+forked (and pickled once per worker elsewhere), and each job is sent only the
+row positions of its partition. Results come back in partition order and are
+merged deterministically, either back into the input row order
+(`concat_rows`) or sorted on the group keys (`concat_sorted`), so the output
+is identical to the serial stage. pipeline.py uses this when `WORKERS` is set
+(`python pipeline.py --workers 8`).
+
+`summarize_years` does the same for several years straight from the
+multi-year store, one (year, county) partition per job:
+
+    python parallel.py --years 2019 2020 2021 --by cds --out summary-district.arrow
+"""
+
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import quality
+import store
+from aggregate import GROUP_KEYS, STATISTICS, summarize
+from education import classify_columns, join_classes
+from ingest import write_arrow
+
+PARTITION_KEYS = ("year", "county")
+
+# Set in each worker process, either inherited on fork or by _init_worker
+_frame = None
+_shared = None
+
+
+def partition_rows(df, keys=PARTITION_KEYS):
+    """{partition key: row positions} of `df` in key order.
+
+    `keys` are column names, of which those present are used, or arrays
+    aligned with `df`. Rows with a missing key form a partition of their own.
+    """
+    keys = [df[key] if isinstance(key, str) else key for key in keys if not isinstance(key, str) or key in df]
+    codes, uniques = zip(*(pd.factorize(key, sort=True, use_na_sentinel=False) for key in keys))
+    group = np.ravel_multi_index(codes, [len(u) for u in uniques])
+    order = np.argsort(group, kind="stable")
+    starts = np.flatnonzero(np.r_[True, group[order][1:] != group[order][:-1]]) if len(order) else []
+    partitions = {}
+    for rows in np.split(order, starts[1:]):
+        if len(rows):
+            values = tuple(np.asarray(u)[c[rows[0]]] for u, c in zip(uniques, codes))
+            partitions[values if len(values) > 1 else values[0]] = rows
+    return partitions
+
+
+def _init_worker(frame, shared):
+    global _frame, _shared
+    _frame, _shared = frame, shared
+
+
+def pool(workers, frame=None, shared=None):
+    """Process pool whose workers see `frame` and the `shared` dict without them being sent per job.
+
+    Use it as a context manager and submit jobs with `submit_shared` (or
+    `map_partitions` for row partitions of `frame`).
+    """
+    global _frame, _shared
+    if "fork" in multiprocessing.get_all_start_methods():
+        # Workers inherit the frames copy-on-write instead of unpickling them
+        _frame, _shared = frame, shared
+        return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+    return ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(frame, shared))
+
+
+def _run_partition(func, rows, kwargs):
+    return func(_frame.iloc[rows], **_shared, **kwargs)
+
+
+def _run_shared(func, args, kwargs):
+    return func(*args, **_shared, **kwargs)
+
+
+def submit_shared(executor, func, *args, **kwargs):
+    """Submit `func(*args, **shared, **kwargs)` to a `pool`, with that pool's `shared` frames."""
+    return executor.submit(_run_shared, func, args, kwargs)
+
+
+def map_partitions(func, frame, partitions, workers=None, shared=None, **kwargs):
+    """Return `func(rows of frame, **shared, **kwargs)` for every partition, in partition order.
+
+    `partitions` are row positions as returned by `partition_rows`. `shared`
+    frames are passed whole to every call without being sent per job; other
+    `kwargs` are pickled with each job, so keep them small.
+    """
+    with pool(workers, frame, shared or {}) as executor:
+        futures = [executor.submit(_run_partition, func, rows, kwargs) for rows in partitions]
+        return [future.result() for future in futures]
+
+
+def concat_rows(parts, positions):
+    """Stack partition results and put their rows back in input order.
+
+    `positions` holds, for every part, the input row position of each of
+    its rows; rows sharing a position keep their order within the part.
+    """
+    order = np.argsort(np.concatenate([np.asarray(p, dtype=np.int64) for p in positions]), kind="stable")
+    return pd.concat(parts, ignore_index=True).take(order).reset_index(drop=True)
+
+
+def concat_sorted(parts, keys):
+    """Stack partition results sorted on `keys`, as a serial groupby would order them."""
+    return pd.concat(parts, ignore_index=True).sort_values(keys, kind="stable", ignore_index=True)
+
+
+def classify(tsal221, workers=None):
+    """`classify_columns` of tsal221, one county per job."""
+    partitions = list(partition_rows(tsal221).values())
+    return concat_rows(map_partitions(classify_columns, tsal221, partitions, workers), partitions)
+
+
+def _join_rows(tsal321, education_classes, excluded):
+    # The same join of the key columns alone gives the tsal321 row of every joined row
+    kept = ~tsal321["cds"].isin(excluded).to_numpy()
+    keys = tsal321.loc[kept, ["cds", "ts3_col"]].assign(row=np.flatnonzero(kept))
+    rows = keys.merge(education_classes[["cds", "ts2_col"]], how="left", left_on=["cds", "ts3_col"],
+                      right_on=["cds", "ts2_col"])["row"].to_numpy()
+    return join_classes(tsal321, education_classes, excluded), rows
+
+
+def join(tsal321, education_classes, excluded=(), workers=None):
+    """`join_classes` of tsal321, one county per job, in tsal321 row order."""
+    partitions = list(partition_rows(tsal321).values())
+    results = map_partitions(_join_rows, tsal321, partitions, workers,
+                             shared={"education_classes": education_classes}, excluded=list(excluded))
+    return concat_rows([part for part, _ in results], [p[rows] for p, (_, rows) in zip(partitions, results)])
+
+
+def summarize_partitioned(teacher_salary, by, tsal121=None, statistics=STATISTICS, workers=None):
+    """`summarize` of teacher_salary, one county per job."""
+    partitions = list(partition_rows(teacher_salary).values())
+    parts = map_partitions(summarize, teacher_salary, partitions, workers, shared={"tsal121": tsal121},
+                           by=by, statistics=statistics)
+    return concat_sorted(parts, [by] + GROUP_KEYS)
+
+
+def _summarize_store(job, by, statistics, store_dir):
+    year, county = job
+    tsal121 = store.query("tsal1", years=[year], counties=[county], store_dir=store_dir)
+    tsal221 = store.query("tsal2", years=[year], counties=[county], store_dir=store_dir).drop(columns="year")
+    tsal321 = store.query("tsal3", years=[year], counties=[county], store_dir=store_dir).drop(columns="year")
+    # Duplicate keys are per district, so one county's rows are enough to find them
+    excluded = quality.excluded_cds(quality.duplicate_keys(tsal321))
+    teacher_salary = join_classes(tsal321, classify_columns(tsal221), excluded)
+    summary = summarize(teacher_salary, by, tsal121, statistics)
+    summary.insert(0, "year", year)
+    return summary
+
+
+def summarize_years(years, by, statistics=STATISTICS, workers=None, store_dir=None):
+    """Per-year summaries of several stored years, one (year, county) partition per job.
+
+    Each job reads only its partition of the store. Returns the summaries
+    stacked with a `year` column, the same as summarizing every year's
+    pipeline serially.
+    """
+    jobs = [(year, county) for year in years for county in store.stored_counties("tsal3", year, store_dir)]
+    with pool(workers) as executor:
+        parts = [future.result() for future in
+                 [executor.submit(_summarize_store, job, by, statistics, store_dir) for job in jobs]]
+    return concat_sorted(parts, ["year", by] + GROUP_KEYS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize several stored years on a process pool.")
+    parser.add_argument("--years", nargs="+", type=int, required=True, help="years to summarize from the store")
+    parser.add_argument("--by", choices=["county", "cds"], default="cds", help="group by county or district")
+    parser.add_argument("--statistics", nargs="+", choices=STATISTICS, default=list(STATISTICS))
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--out", required=True, help="Arrow file the summary is written to")
+    args = parser.parse_args(argv)
+    store.ingest_all()
+    summary = summarize_years(args.years, args.by, args.statistics, args.workers)
+    write_arrow(summary, args.out)
+    print(f"{len(summary)} groups written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""Content-hashed incremental build of the salary maps.
+
+`ca_teacher_salaries.py` split into explicit stages: ingest, classify, join,
+geometry-prep, summarize, aggregate and render. Every stage output is cached under
+a key hashed from its inputs' keys, its parameters and the source of the code
+that builds it, so a rerun only executes stages whose inputs changed. Changing
+a title or the legend only reruns the render stage.
+
+Run `python pipeline.py` to build the two maps from the notebook, and add
+`--report build.json` (optionally `--profile cprofile`) to record every stage
+with instrument.py. `--tiles DIR` also builds each map's layer offline as a
+vector tile pyramid (a cached `tiles` stage) under DIR, for static hosting.
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import geopandas as gpd
+
+import choropleth
+import instrument
+import maps
+import parallel
+import quality
+import store
+import tiles
+from aggregate import STATISTICS, rank_statistic, summarize
+from education import BA_OR_MA, MA_OR_BA_UNITS, classify_columns, join_classes
+from geometry import COUNTIES_SHP, DISTRICTS_SHP, LEVELS, layer_path, load_layer
+from ingest import CACHE_DIR, DATA_DIR, cache_path, file_hash, load_table, read_arrow, write_arrow
+
+
+class StageOutput(NamedTuple):
+    key: str
+    value: Any
+
+
+# Print which stages ran and which were read from the cache
+VERBOSE = False
+# Processes the classify, join and summary stages run on, one county per job
+# (see parallel.py); None runs them in this process. Outputs are the same.
+WORKERS = None
+
+
+def _digest(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode() if isinstance(part, str) else part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _source(obj):
+    return inspect.getsource(obj)
+
+
+def _instrumented(name, run, deps=()):
+    """Call `run()`, recording it as stage `name` when instrument.py is enabled."""
+    if not instrument.ENABLED:
+        return run()[0]
+    with instrument.stage(name, [dep.value for dep in deps]) as record:
+        output, status = run()
+        record.set_output(output.value, status)
+    return output
+
+
+def run_stage(name, build, deps=(), params=None, kind="arrow", code=(), cache_dir=None):
+    """Run `build(*dep values, **params)` unless its output is cached under the same key.
+
+    `kind` is how the output is stored: "arrow" for DataFrames, "geoparquet"
+    for GeoDataFrames, or a file suffix such as "html", in which case `build`
+    is passed the `path` to write to and the stage value is that path. `code`
+    lists extra functions or modules whose source is part of the key.
+    """
+    return _instrumented(name, lambda: _run_stage(name, build, deps, params or {}, kind, code, cache_dir), deps)
+
+
+def _run_stage(name, build, deps, params, kind, code, cache_dir):
+    key = _digest(name, _source(build), *map(_source, code), *(dep.key for dep in deps),
+                  json.dumps(params, sort_keys=True, default=str))
+    suffix = {"arrow": "arrow", "geoparquet": "parquet"}.get(kind, kind)
+    path = Path(cache_dir or CACHE_DIR) / "stages" / f"{name}-{key[:16]}.{suffix}"
+    start = time.perf_counter()
+    if path.exists():
+        status = "cached"
+    else:
+        status = "built"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        args = [dep.value for dep in deps]
+        if kind == "arrow":
+            write_arrow(build(*args, **params), path)
+        elif kind == "geoparquet":
+            tmp = path.with_suffix(".tmp")
+            build(*args, **params).to_parquet(tmp)
+            tmp.replace(path)
+        else:
+            tmp = path.with_suffix(".tmp" + path.suffix)
+            build(*args, path=tmp, **params)
+            tmp.replace(path)
+    if kind == "arrow":
+        value = read_arrow(path).to_pandas()
+    elif kind == "geoparquet":
+        value = gpd.read_parquet(path)
+    else:
+        value = path
+    if VERBOSE:
+        print(f"{name:<16} {status:<7} {time.perf_counter() - start:6.2f}s")
+    return StageOutput(key, value), status
+
+
+def ingest(name, data_dir=None, year=None):
+    """Typed CDE table `name`; ingest.py keeps its own cache keyed on the CSV hash and parsing code.
+
+    With a `year`, the table is read from that year's partitions of the
+    multi-year store instead, keyed on the hash of the extract it came from.
+    """
+    if year is not None:
+        return _instrumented(f"ingest-{name}", lambda: _ingest_year(name[:5], year))
+
+    def run():
+        source_hash = file_hash(Path(data_dir or DATA_DIR) / f"{name}.csv")
+        # The cache file name already covers the parsing code and dtypes
+        key = _digest("ingest", cache_path(name, source_hash).name, _source(load_table))
+        return StageOutput(key, load_table(name, data_dir)), None
+
+    return _instrumented(f"ingest-{name}", run)
+
+
+def _ingest_year(table, year):
+    source_hash = store.read_manifest().get(table, {}).get(str(year))
+    if source_hash is None:
+        raise ValueError(f"no {table} extract for {year} in the store")
+    key = _digest("ingest", table, str(year), source_hash, _source(store))
+    return StageOutput(key, store.query(table, years=[year]).drop(columns="year")), None
+
+
+def _classify(tsal221):
+    if WORKERS:
+        return parallel.classify(tsal221, WORKERS)
+    return classify_columns(tsal221)
+
+
+def classify(tsal221):
+    return run_stage("classify", _classify, [tsal221], code=[inspect.getmodule(classify_columns)])
+
+
+def _validate(tsal121, tsal221, tsal321, districts):
+    return quality.validate(tsal121, tsal221, tsal321, districts)
+
+
+def validate(tsal121, tsal221, tsal321, districts):
+    """Quarantine table of every data-quality issue found in the tables (see quality.py)."""
+    return run_stage("validate", _validate, [tsal121, tsal221, tsal321, districts], code=[quality])
+
+
+def _join_valid(tsal321, education_classes, quarantine):
+    if WORKERS:
+        return parallel.join(tsal321, education_classes, quality.excluded_cds(quarantine), WORKERS)
+    return join_classes(tsal321, education_classes, quality.excluded_cds(quarantine))
+
+
+def join(tsal321, education_classes, quarantine):
+    """Salaries with their education class, leaving out districts the quarantine excludes."""
+    return run_stage("join", _join_valid, [tsal321, education_classes, quarantine], code=[join_classes])
+
+
+def geometry_prep(shapefile, level, zoom=9):
+    """Cleaned, simplified WGS84 layer; geometry.py keeps its own cache keyed on the shapefile and code."""
+    def run():
+        key = _digest("geometry", layer_path(shapefile, level, zoom).name)
+        return StageOutput(key, load_layer(shapefile, level, zoom)), None
+
+    return _instrumented(f"geometry-{level}", run)
+
+
+def _summarize(teacher_salary, tsal121, level, statistics):
+    by = "county" if level == "county" else "cds"
+    if WORKERS:
+        return parallel.summarize_partitioned(teacher_salary, by, tsal121, statistics, WORKERS)
+    return summarize(teacher_salary, by, tsal121, statistics)
+
+
+def summary(teacher_salary, tsal121, level, statistics=STATISTICS):
+    """Every statistic for every (county or district, step, education class) in one table."""
+    return run_stage(f"summary-{level}", _summarize, [teacher_salary, tsal121],
+                     params={"level": level, "statistics": list(statistics)}, code=[inspect.getmodule(summarize), parallel])
+
+
+def _aggregate(summary, geometry, level, step, classes, statistic):
+    by, key = ("county", "COUNTY_NUM") if level == "county" else ("cds", "cds")
+    return rank_statistic(summary, by, step, classes, statistic, groups=geometry[key])
+
+
+def aggregate(summary, geometry, level, step, classes, statistic="mean"):
+    """Counties or districts ranked on one statistic for one step and set of education classes."""
+    return run_stage("aggregate", _aggregate, [summary, geometry],
+                     params={"level": level, "step": step, "classes": list(classes), "statistic": statistic},
+                     code=[inspect.getmodule(rank_statistic)])
+
+
+def _render(avg_salary, geometry, level, title, legend_title, path, static=False, tiles_url=None):
+    layer, bins = maps.salary_layer(avg_salary, geometry, level)
+    maps.draw_map(layer, bins, level, title, legend_title, path, static=static, tiles_url=tiles_url)
+
+
+def render(avg_salary, geometry, level, title, legend_title, static=False, tiles_url=None):
+    """HTML map for one aggregate; the value is the cached HTML path."""
+    return run_stage("render", _render, [avg_salary, geometry],
+                     params={"level": level, "title": title, "legend_title": legend_title, "static": static,
+                             "tiles_url": tiles_url},
+                     kind="html", code=[maps, choropleth, tiles])
+
+
+def _vector_tiles(avg_salary, geometry, *zoom_layers, level, path):
+    layer, _ = maps.salary_layer(avg_salary, geometry, level)
+    properties = maps.tile_properties(layer, level)
+    key = maps.LAYER_KEYS[level]
+    levels = {zoom: zoom_layer[[key, "geometry"]].merge(properties, on=key)
+              for zoom, zoom_layer in zip(LEVELS, zoom_layers)}
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True)
+    tiles.build_tiles(levels, path, level, list(properties.columns))
+
+
+def vector_tiles(avg_salary, geometry, shapefile, level):
+    """Vector tile pyramid of one aggregate, each zoom cut from the layer simplified for it.
+
+    The value is the cached tile directory.
+    """
+    zoom_layers = [geometry_prep(shapefile, level, zoom) for zoom in LEVELS]
+    return run_stage("tiles", _vector_tiles, [avg_salary, geometry, *zoom_layers], params={"level": level},
+                     kind="tiles", code=[maps, choropleth, tiles])
+
+
+def load_prepared(counties_path=COUNTIES_SHP, districts_path=DISTRICTS_SHP, year=None):
+    """Run the stages shared by every map; returns their StageOutputs by name.
+
+    `year` builds from that year's extracts in the multi-year store rather than
+    the 2020-21 CSVs.
+    """
+    if year is not None:
+        store.ingest_all()
+    tsal121 = ingest("tsal121", year=year)
+    tsal221 = ingest("tsal221", year=year)
+    tsal321 = ingest("tsal321", year=year)
+    district = geometry_prep(districts_path, "district")
+    quarantine = validate(tsal121, tsal221, tsal321, district)
+    teacher_salary = join(tsal321, classify(tsal221), quarantine)
+    return {
+        "tsal121": tsal121,
+        "quarantine": quarantine,
+        "teacher_salary": teacher_salary,
+        "county": geometry_prep(counties_path, "county"),
+        "district": district,
+        "summary-county": summary(teacher_salary, tsal121, "county"),
+        "summary-district": summary(teacher_salary, tsal121, "district"),
+    }
+
+
+def build_map(prepared, level, step, classes, title, legend_title, out_path, statistic="mean", static=False,
+              tiles_dir=None, shapefile=None):
+    """Aggregate and render one map through the stage cache and copy it to `out_path`.
+
+    `static` writes the map for static hosting: shared assets next to it,
+    compact geometry and precompressed copies (see `maps.save_static`).
+    `tiles_dir` writes the layer as a vector tile pyramid from `shapefile`
+    under `tiles_dir/<map name>` and has the map load it from there (over
+    http) instead of embedding it.
+    """
+    avg_salary = aggregate(prepared[f"summary-{level}"], prepared[level], level, step, classes, statistic)
+    tiles_url = None
+    if tiles_dir is not None:
+        pyramid = vector_tiles(avg_salary, prepared[level], shapefile, level)
+        target = Path(tiles_dir) / Path(out_path).stem
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.copytree(pyramid.value, target)
+        tiles_url = Path(os.path.relpath(target, Path(out_path).parent)).as_posix() + "/{z}/{x}/{y}.pbf"
+    html = render(avg_salary, prepared[level], level, title, legend_title, static, tiles_url)
+    shutil.copyfile(html.value, out_path)
+    if static:
+        maps.write_assets(Path(out_path).parent)
+        maps.precompress(out_path)
+    return Path(out_path)
+
+
+def main(argv=None):
+    global VERBOSE, WORKERS
+    parser = argparse.ArgumentParser(description="Incrementally build the county and district salary maps.")
+    parser.add_argument("--out-dir", default=".", help="directory the HTML maps are written to")
+    parser.add_argument("--counties", default=COUNTIES_SHP, help="county shapefile")
+    parser.add_argument("--districts", default=DISTRICTS_SHP, help="school district shapefile")
+    parser.add_argument("--year", type=int, help="build from this school year's extracts in the multi-year store")
+    parser.add_argument("--quarantine", help="write the data-quality quarantine table to this CSV")
+    parser.add_argument("--static", action="store_true",
+                        help="write maps for static hosting, with shared assets and precompressed copies")
+    parser.add_argument("--tiles", metavar="DIR",
+                        help="write the map layers as vector tile pyramids under DIR, which the maps load over http")
+    parser.add_argument("--workers", type=int,
+                        help="run the classify, join and summary stages on this many processes, one county per job")
+    parser.add_argument("--report", help="record every stage and write a JSON report here")
+    parser.add_argument("--profile", choices=["cprofile", "pyinstrument"],
+                        help="also profile the stages and keep the slowest one's profile (needs --report)")
+    args = parser.parse_args(argv)
+    VERBOSE = True
+    WORKERS = args.workers
+    if args.profile and not args.report:
+        parser.error("--profile needs --report")
+    if args.report:
+        instrument.enable(args.profile)
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    prepared = load_prepared(args.counties, args.districts, args.year)
+    quarantine = prepared["quarantine"].value
+    for check, count in quarantine["check"].value_counts().sort_index().items():
+        print(f"{check:<16} {count} issues")
+    if args.quarantine:
+        quarantine.to_csv(args.quarantine, index=False)
+    build_map(prepared, "county", 1, BA_OR_MA,
+              'Average Salary by County for a 1st Year Teacher with a Masters or Bachelors',
+              'Avg. Salary for BA/MA Teachers by County', out_dir / "ca_teacher_salary_by_county.html",
+              static=args.static, tiles_dir=args.tiles, shapefile=args.counties)
+    build_map(prepared, "district", 1, MA_OR_BA_UNITS,
+              'Average District Salary for a 1st Year Teacher with a Masters (or Bachelors with significant units)',
+              'Avg. Salary for BA/MA Teachers by School District', out_dir / "ca_teacher_salary_by_district.html",
+              static=args.static, tiles_dir=args.tiles, shapefile=args.districts)
+    if args.report:
+        instrument.write_report(args.report)
+        print(instrument.summary())
+
+
+if __name__ == "__main__":
+    main()
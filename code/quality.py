@@ -0,0 +1,128 @@
+"""Vectorized data-quality checks over the CDE tables.
+
+Each check is one vectorized pass that returns the offending rows in a common
+quarantine layout: the check name, the district, the step and column where
+they apply, and a detail message. `validate` runs every check and stacks the
+results. The checks are:
+
+- duplicate_key: several salaries for one (cds, step, column). These districts
+  are excluded from every average, as Browns Elementary (5171365) used to be
+  by hand, since their rows would silently inflate them.
+- non_monotonic: a salary lower than the one at the previous step of the same
+  column. Reported only.
+- missing_column: a tsal321 column with no description in tsal221, so it has
+  no education class and drops out of every map. Reported only.
+- missing_district: a district in the shapefile with no tsal121 record, so it
+  is drawn as missing. Reported only.
+
+When the tables carry a `year` column (multi-year loads from store.py) every
+key includes the year.
+"""
+
+import argparse
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from geometry import DISTRICTS_SHP
+from ingest import load_table
+
+# Checks whose districts are excluded from the salary averages
+EXCLUDING_CHECKS = ("duplicate_key",)
+
+
+def _year(df):
+    return ["year"] if "year" in df.columns else []
+
+
+def _issues(check, df, cds, step=None, column=None, detail=None):
+    """Build quarantine rows from aligned arrays (or None for an empty field)."""
+    n = len(df)
+    issues = pd.DataFrame({
+        "check": np.full(n, check, dtype=object),
+        "cds": np.asarray(cds).astype(str),
+        "step": pd.array(np.full(n, pd.NA) if step is None else step, dtype="Int16"),
+        "column": pd.array(np.full(n, pd.NA) if column is None else column, dtype="Int16"),
+        "detail": np.full(n, "", dtype=object) if detail is None else np.asarray(detail, dtype=object),
+    })
+    for col in _year(df):
+        issues.insert(0, col, df[col].to_numpy())
+    return issues
+
+
+def _key_hash(df, columns):
+    return pd.util.hash_pandas_object(df[columns].astype({"cds": str}), index=False).to_numpy()
+
+
+def duplicate_keys(tsal321):
+    """One row per (cds, step, column) that has more than one salary."""
+    keys = _year(tsal321) + ["cds", "ts3_step", "ts3_col"]
+    hashed = _key_hash(tsal321, keys)
+    duplicated = pd.Series(hashed).duplicated(keep=False).to_numpy()
+    rows, hashed = tsal321[duplicated], hashed[duplicated]
+    # Groups come out in order of first appearance, aligned with `first`
+    stats = rows["ts3_salary"].astype("float64").groupby(hashed, sort=False).agg(["size", "min", "max"])
+    first = rows[~pd.Series(hashed).duplicated().to_numpy()]
+    detail = [f"{n} salaries from ${lo:,.2f} to ${hi:,.2f}" for n, lo, hi in stats.itertuples(index=False)]
+    return _issues("duplicate_key", first, first["cds"], first["ts3_step"], first["ts3_col"], detail)
+
+
+def non_monotonic_schedules(tsal321):
+    """Rows whose salary is below the salary at the previous step of the same column."""
+    keys = _year(tsal321) + ["cds", "ts3_col"]
+    df = tsal321.sort_values(keys + ["ts3_step"], kind="stable")
+    group = _key_hash(df, keys)
+    salary = df["ts3_salary"].to_numpy(dtype="float64")
+    falls = np.r_[False, (group[1:] == group[:-1]) & (salary[1:] < salary[:-1])]
+    previous = np.r_[np.nan, salary[:-1]][falls]
+    rows = df[falls]
+    detail = [f"${prev:,.2f} at the previous step, ${cur:,.2f} here" for prev, cur in zip(previous, salary[falls])]
+    return _issues("non_monotonic", rows, rows["cds"], rows["ts3_step"], rows["ts3_col"], detail)
+
+
+def missing_columns(tsal321, tsal221):
+    """One row per (cds, column) used in tsal321 with no tsal221 description."""
+    keys = [col for col in _year(tsal321) if col in tsal221.columns] + ["cds"]
+    used = tsal321[keys + ["ts3_col"]].drop_duplicates()
+    described = _key_hash(tsal221.rename(columns={"ts2_col": "ts3_col"}), keys + ["ts3_col"])
+    rows = used[~np.isin(_key_hash(used, keys + ["ts3_col"]), described)]
+    return _issues("missing_column", rows, rows["cds"], column=rows["ts3_col"])
+
+
+def missing_districts(districts, tsal121):
+    """Shapefile districts with no tsal121 record."""
+    cds = districts["CDCode"] if "CDCode" in districts.columns else districts["cds"]
+    rows = districts[~cds.astype(str).isin(tsal121["cds"].astype(str))]
+    cds = cds[rows.index]
+    names = rows["DistrictNa"] if "DistrictNa" in rows.columns else None
+    return _issues("missing_district", rows, cds, detail=names)
+
+
+def validate(tsal121, tsal221, tsal321, districts=None):
+    """Run every check and return the stacked quarantine table."""
+    checks = [duplicate_keys(tsal321), non_monotonic_schedules(tsal321), missing_columns(tsal321, tsal221)]
+    if districts is not None:
+        checks.append(missing_districts(districts, tsal121))
+    return pd.concat(checks, ignore_index=True)
+
+
+def excluded_cds(quarantine):
+    """Districts to leave out of the salary averages."""
+    return sorted(set(quarantine.loc[quarantine["check"].isin(EXCLUDING_CHECKS), "cds"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the CDE tables and write the quarantine table.")
+    parser.add_argument("--districts", default=DISTRICTS_SHP, help="school district shapefile")
+    parser.add_argument("--out", default="quarantine.csv", help="CSV the quarantine table is written to")
+    args = parser.parse_args(argv)
+    districts = gpd.read_file(args.districts, ignore_geometry=True)
+    quarantine = validate(load_table("tsal121"), load_table("tsal221"), load_table("tsal321"), districts)
+    quarantine.to_csv(args.out, index=False)
+    print(quarantine["check"].value_counts().to_string())
+    print(f"Excluded from averages: {', '.join(excluded_cds(quarantine)) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Batch renderer: one county and one district map per (step, education class).
+
+The salary tables and map geometry are loaded and joined once, then every
+(level, step, education class) map is rendered on a process pool that shares
+the prepared frames. Maps go through the stage cache in pipeline.py, so only
+maps whose inputs changed are re-rendered. Run `python render.py --help` for
+options.
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import as_completed
+from pathlib import Path
+
+import parallel
+import pipeline
+from education import EDUCATION_CLASSES, EDUCATION_LABELS
+from geometry import COUNTIES_SHP, DISTRICTS_SHP
+from maps import write_assets
+from pipeline import build_map, load_prepared
+
+LEVELS = ("county", "district")
+
+
+def map_jobs(prepared, levels=LEVELS, steps=None, classes=None):
+    """Return every (level, step, education class) combination present in the data."""
+    teacher_salary = prepared["teacher_salary"].value
+    present = teacher_salary[["years_experience", "education_class"]].dropna().drop_duplicates()
+    if steps is not None:
+        present = present[present["years_experience"].isin(steps)]
+    if classes is not None:
+        present = present[present["education_class"].isin(classes)]
+    present = present.sort_values(["years_experience", "education_class"])
+    return [(level, int(step), str(cls)) for level in levels
+            for step, cls in zip(present["years_experience"], present["education_class"])]
+
+
+def render_map(prepared, level, step, education_class, out_dir, static=False, tiles_dir=None, shapefile=None):
+    """Render one map to `out_dir` through the stage cache and return its path.
+
+    `tiles_dir` and `shapefile` are passed to `pipeline.build_map`.
+    """
+    label = EDUCATION_LABELS[education_class]
+    if level == "county":
+        title = f'Average Salary by County for a Step {step} Teacher ({label})'
+        legend_title = f'Avg. Salary for {label} Teachers by County'
+    else:
+        title = f'Average District Salary for a Step {step} Teacher ({label})'
+        legend_title = f'Avg. Salary for {label} Teachers by School District'
+    path = Path(out_dir) / f"ca_teacher_salary_by_{level}_step{step}_{education_class.lower()}.html"
+    return build_map(prepared, level, step, [education_class], title, legend_title, path, static=static,
+                     tiles_dir=tiles_dir, shapefile=shapefile)
+
+
+def _run_job(job, out_dir, static, tiles_dir, shapefiles, prepared):
+    start = time.perf_counter()
+    path = render_map(prepared, *job, out_dir, static, tiles_dir, shapefiles.get(job[0]))
+    return job, str(path), time.perf_counter() - start
+
+
+def render_all(prepared, jobs, out_dir, workers=None, static=False, tiles_dir=None, shapefiles=None):
+    """Render `jobs` on a process pool; return a list of per-job timing records.
+
+    `tiles_dir` writes every map's layer as a vector tile pyramid, cut from
+    `shapefiles[level]`, that the map loads instead of embedding it.
+    """
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    if static:
+        # Written once here rather than raced for by every worker
+        write_assets(out_dir)
+    records = []
+    # Workers get the prepared frames once, not with every job
+    with parallel.pool(workers, shared={"prepared": prepared}) as pool:
+        futures = [parallel.submit_shared(pool, _run_job, job, out_dir, static, tiles_dir, shapefiles or {})
+                   for job in jobs]
+        for future in as_completed(futures):
+            (level, step, education_class), path, seconds = future.result()
+            print(f"{level:<8} step {step:<3} {education_class:<10} {seconds:6.2f}s  {path}")
+            records.append({"level": level, "step": step, "education_class": education_class,
+                            "path": path, "seconds": seconds})
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out-dir", default="maps", help="directory the HTML maps are written to")
+    parser.add_argument("--levels", nargs="+", choices=LEVELS, default=list(LEVELS))
+    parser.add_argument("--steps", nargs="+", type=int, help="salary steps to render (default: all)")
+    parser.add_argument("--classes", nargs="+", choices=EDUCATION_CLASSES, help="education classes to render (default: all)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--counties", default=COUNTIES_SHP, help="county shapefile")
+    parser.add_argument("--districts", default=DISTRICTS_SHP, help="school district shapefile")
+    parser.add_argument("--static", action="store_true",
+                        help="write maps for static hosting, with shared assets and precompressed copies")
+    parser.add_argument("--tiles", metavar="DIR",
+                        help="write the map layers as vector tile pyramids under DIR, which the maps load over http")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    pipeline.WORKERS = args.workers
+    prepared = load_prepared(args.counties, args.districts)
+    print(f"Loaded and joined data in {time.perf_counter() - start:.2f}s")
+    jobs = map_jobs(prepared, args.levels, args.steps, args.classes)
+    records = render_all(prepared, jobs, args.out_dir, args.workers, args.static, args.tiles,
+                         {"county": args.counties, "district": args.districts})
+    total = time.perf_counter() - start
+    print(f"Rendered {len(records)} maps in {total:.2f}s")
+    with open(Path(args.out_dir) / "timings.json", "w") as f:
+        json.dump({"total_seconds": total, "jobs": records}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Dense district x step x column salary cube with direct-index lookups.
+
+Answers "given a teacher's years of applicable experience and their education
+level, return the exact salary for that teacher at each district" without
+merging and filtering the salary tables per query. The cube is persisted as a
+`.npy` file so any number of processes can memory-map it without copying.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ingest import CACHE_DIR, DATA_DIR, cache_path, file_hash, fingerprint, load_table
+from quality import duplicate_keys
+
+
+class SalaryCube:
+    """Salaries indexed by (district, step, column); missing cells are NaN."""
+
+    def __init__(self, values, cds, step_start, column_start):
+        self.values = values
+        self.cds = pd.Index(cds, name="cds")
+        self.step_start = int(step_start)
+        self.column_start = int(column_start)
+
+    @property
+    def steps(self):
+        return np.arange(self.step_start, self.step_start + self.values.shape[1])
+
+    @property
+    def columns(self):
+        return np.arange(self.column_start, self.column_start + self.values.shape[2])
+
+    def lookup(self, cds, step, column):
+        """Return the salary for one (cds, step, column), or NaN if there is none."""
+        i = self.cds.get_loc(cds) if cds in self.cds else -1
+        s = step - self.step_start
+        c = column - self.column_start
+        if i < 0 or not 0 <= s < self.values.shape[1] or not 0 <= c < self.values.shape[2]:
+            return np.nan
+        return float(self.values[i, s, c])
+
+    def lookup_many(self, cds, steps, columns):
+        """Vectorized `lookup` over equal-length sequences of cds, steps and columns."""
+        i = self.cds.get_indexer(pd.Index(cds).astype(str))
+        s = np.asarray(steps, dtype=np.int64) - self.step_start
+        c = np.asarray(columns, dtype=np.int64) - self.column_start
+        valid = (i >= 0) & (s >= 0) & (s < self.values.shape[1]) & (c >= 0) & (c < self.values.shape[2])
+        out = np.full(len(i), np.nan, dtype=self.values.dtype)
+        out[valid] = self.values[i[valid], s[valid], c[valid]]
+        return out
+
+    def at(self, step, column):
+        """Return the salary at every district for one (step, column) as a Series indexed by cds."""
+        s = step - self.step_start
+        c = column - self.column_start
+        if not 0 <= s < self.values.shape[1] or not 0 <= c < self.values.shape[2]:
+            return pd.Series(np.nan, index=self.cds, name="salary", dtype=self.values.dtype)
+        return pd.Series(self.values[:, s, c], index=self.cds, name="salary")
+
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / "salary_cube.npy", np.ascontiguousarray(self.values))
+        with open(directory / "salary_cube.json", "w") as f:
+            json.dump({"cds": list(self.cds), "step_start": self.step_start, "column_start": self.column_start}, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = Path(directory)
+        with open(directory / "salary_cube.json") as f:
+            meta = json.load(f)
+        values = np.load(directory / "salary_cube.npy", mmap_mode="r" if mmap else None)
+        return cls(values, meta["cds"], meta["step_start"], meta["column_start"])
+
+
+def build_cube(tsal321):
+    """Scatter the long-format tsal321 table into a dense SalaryCube.
+
+    Districts with several salaries for one step and column are left out.
+    """
+    tsal321 = tsal321[~tsal321["cds"].isin(duplicate_keys(tsal321)["cds"])]
+    cds = pd.Index(tsal321["cds"].astype(str).unique()).sort_values()
+    steps = tsal321["ts3_step"].to_numpy()
+    columns = tsal321["ts3_col"].to_numpy()
+    step_start, column_start = int(steps.min()), int(columns.min())
+    shape = (len(cds), int(steps.max()) - step_start + 1, int(columns.max()) - column_start + 1)
+    values = np.full(shape, np.nan, dtype=np.float32)
+    values[cds.get_indexer(tsal321["cds"].astype(str)), steps - step_start, columns - column_start] = tsal321["ts3_salary"].to_numpy()
+    return SalaryCube(values, cds, step_start, column_start)
+
+
+def cube_directory(data_dir=None, cache_dir=None):
+    """Cache directory of the cube, keyed on the tsal321 cache and the code that builds the cube."""
+    table = cache_path("tsal321", file_hash(Path(data_dir or DATA_DIR) / "tsal321.csv")).name
+    return Path(cache_dir or CACHE_DIR) / f"salary_cube-{fingerprint(table, build_cube, duplicate_keys)[:16]}"
+
+
+def load_cube(data_dir=None, cache_dir=None):
+    """Return the memory-mapped SalaryCube for the current tsal321, building it if needed."""
+    directory = cube_directory(data_dir, cache_dir)
+    if not (directory / "salary_cube.json").exists():
+        tmp = directory.with_suffix(".tmp")
+        build_cube(load_table("tsal321", data_dir, cache_dir)).save(tmp)
+        os.replace(tmp, directory)
+    return SalaryCube.load(directory)
@@ -0,0 +1,263 @@
+"""Local asyncio HTTP/JSON query service over the prepared salary data.
+
+The pipeline stages, salary cube and spatial indexes are loaded once at
+startup; each query is then answered from memory and repeated queries from an
+LRU cache. Only the standard library is used for serving.
+
+Endpoints (all GET, parameters in the query string):
+
+    /salary    cds, step, column, [measure] salary (or a compensation measure)
+                                            from the salary cube
+    /rankings  level, step, classes, [statistic, county, measure]
+                                            counties, or districts (optionally
+                                            within one county), ranked
+    /top       step, classes, [n, statistic, measure]
+                                            top-n districts statewide
+    /nearby    lat, lon, miles, step, classes, [statistic, measure]
+                                            districts within a radius, ranked
+    /stats                                  request, latency and cache counters
+
+`classes` is a comma separated list of education classes, e.g. `BA_UNITS,MA`.
+`measure` is `salary` (the default) or one of the compensation.py measures,
+e.g. `total_family`; their summaries and cubes are precomputed too.
+Run `python service.py --help` for options.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+import traceback
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+import compensation
+import pipeline
+from aggregate import QUANTILES, STATISTICS, rank_statistic
+from education import EDUCATION_CLASSES
+from geometry import COUNTIES_SHP, DISTRICTS_SHP
+from salary_cube import load_cube
+from spatial import district_index
+
+MAX_REQUEST_LINE = 8192
+
+
+class QueryError(ValueError):
+    """A bad query; reported to the client as a 400."""
+
+
+class SalaryService:
+    def __init__(self, counties_path=COUNTIES_SHP, districts_path=DISTRICTS_SHP, cache_size=1024):
+        prepared = pipeline.load_prepared(counties_path, districts_path)
+        self.summaries = {("salary", level): prepared[f"summary-{level}"].value for level in ("county", "district")}
+        self.summaries.update({(measure, level): compensation.measure_summary(prepared, level, measure).value
+                               for measure in compensation.MEASURES for level in ("county", "district")})
+        self.counties = prepared["county"].value[["COUNTY_NUM", "COUNTY_NAM"]]
+        self.districts = prepared["district"].value[["cds", "DistrictNa"]]
+        self.cubes = {"salary": load_cube()}
+        self.cubes.update({measure: compensation.load_compensation(measure) for measure in compensation.MEASURES})
+        self.district_index = district_index(districts_path)
+        self.answer = lru_cache(maxsize=cache_size)(self._answer)
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    # Query parsing
+
+    @staticmethod
+    def _get(params, name, cast=str, default=None):
+        if name not in params:
+            if default is None:
+                raise QueryError(f"missing parameter {name!r}")
+            return default
+        try:
+            return cast(params[name])
+        except ValueError:
+            raise QueryError(f"bad value for {name!r}: {params[name]!r}")
+
+    def _finite(self, params, name):
+        value = self._get(params, name, float)
+        if not math.isfinite(value):
+            raise QueryError(f"{name!r} must be a finite number, got {params[name]!r}")
+        return value
+
+    def _classes(self, params):
+        classes = self._get(params, "classes").upper()
+        if not classes.strip(","):
+            raise QueryError("no education classes given in 'classes'")
+        classes = classes.split(",")
+        unknown = set(classes) - set(EDUCATION_CLASSES)
+        if unknown:
+            raise QueryError(f"unknown education classes {sorted(unknown)}")
+        return classes
+
+    def _statistic(self, params):
+        statistic = self._get(params, "statistic", default="mean")
+        if statistic not in STATISTICS:
+            raise QueryError(f"unknown statistic {statistic!r}")
+        return statistic
+
+    def _measure(self, params):
+        measure = self._get(params, "measure", default="salary")
+        if measure not in self.cubes:
+            raise QueryError(f"unknown measure {measure!r}")
+        return measure
+
+    def _ranking(self, level, step, classes, statistic, measure="salary"):
+        if statistic in QUANTILES and len(set(classes)) > 1:
+            raise QueryError(f"{statistic} cannot be combined across education classes, pick one class")
+        by, names, key = (("county", self.counties, "COUNTY_NUM") if level == "county"
+                          else ("cds", self.districts, "cds"))
+        ranking = rank_statistic(self.summaries[measure, level], by, step, classes, statistic, groups=names[key])
+        return ranking.merge(names, how="left", left_on=by, right_on=key).drop(columns=[key] if key != by else [])
+
+    # Endpoints
+
+    def salary(self, params):
+        cube = self.cubes[self._measure(params)]
+        salary = cube.lookup(self._get(params, "cds"), self._get(params, "step", int), self._get(params, "column", int))
+        return {"salary": None if math.isnan(salary) else salary}
+
+    def rankings(self, params):
+        level = self._get(params, "level", default="county")
+        if level not in ("county", "district"):
+            raise QueryError(f"unknown level {level!r}")
+        ranking = self._ranking(level, self._get(params, "step", int), self._classes(params), self._statistic(params),
+                                self._measure(params))
+        county = params.get("county")
+        if county is not None and level == "district":
+            ranking = ranking[ranking["cds"].str[:2] == county.rjust(2, "0")]
+            ranking = ranking.assign(county_rank=np.arange(1, len(ranking) + 1))
+        return {"results": ranking.to_dict("records")}
+
+    def top(self, params):
+        ranking = self._ranking("district", self._get(params, "step", int), self._classes(params), self._statistic(params),
+                                self._measure(params))
+        n = self._get(params, "n", int, default=10)
+        if n < 0:
+            raise QueryError(f"n must not be negative, got {n}")
+        return {"results": ranking.head(n).to_dict("records")}
+
+    def nearby(self, params):
+        ranking = self._ranking("district", self._get(params, "step", int), self._classes(params), self._statistic(params),
+                                self._measure(params))
+        miles = self._finite(params, "miles")
+        if miles < 0:
+            raise QueryError(f"miles must not be negative, got {miles}")
+        nearby = self.district_index.ranked_within(self._finite(params, "lat"), self._finite(params, "lon"), miles,
+                                                   ranking[["cds", "salary", "salary_rank"]])
+        return {"results": nearby.to_dict("records")}
+
+    def stats(self, params):
+        uptime = time.monotonic() - self.started
+        cache = self.answer.cache_info()
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "uptime_seconds": uptime,
+            "requests_per_second": self.requests / uptime if uptime else 0.0,
+            "mean_latency_ms": 1000 * self.latency_total / self.requests if self.requests else 0.0,
+            "max_latency_ms": 1000 * self.latency_max,
+            "cache": {"hits": cache.hits, "misses": cache.misses, "size": cache.currsize, "max_size": cache.maxsize},
+        }
+
+    ENDPOINTS = {"/salary": salary, "/rankings": rankings, "/top": top, "/nearby": nearby}
+
+    def _answer(self, path, query):
+        # Cached on (path, sorted query items); returns the encoded JSON body
+        return json.dumps(self.ENDPOINTS[path](self, dict(query)), default=_json_default).encode()
+
+    def handle(self, target):
+        """Return (status, body) for a request target such as `/top?step=1&classes=MA`."""
+        start = time.perf_counter()
+        url = urlsplit(target)
+        try:
+            if url.path == "/stats":
+                status, body = 200, json.dumps(self.stats({})).encode()
+            elif url.path in self.ENDPOINTS:
+                status, body = 200, self.answer(url.path, tuple(sorted(parse_qsl(url.query, keep_blank_values=True))))
+            else:
+                status, body = 404, json.dumps({"error": f"unknown endpoint {url.path}"}).encode()
+        except QueryError as e:
+            status, body = 400, json.dumps({"error": str(e)}).encode()
+        except Exception:
+            # Still answered and counted, so one bad query never drops the connection
+            traceback.print_exc()
+            status, body = 500, json.dumps({"error": "internal error"}).encode()
+        elapsed = time.perf_counter() - start
+        self.requests += 1
+        self.errors += status != 200
+        self.latency_total += elapsed
+        self.latency_max = max(self.latency_max, elapsed)
+        return status, body
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+        return None if isinstance(value, float) and math.isnan(value) else value
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+async def _serve_connection(service, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line or len(request_line) > MAX_REQUEST_LINE:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            method, target, version = (request_line.decode("latin-1").split() + ["", "", ""])[:3]
+            if method == "GET":
+                status, body = service.handle(target)
+            else:
+                status, body = 405, b'{"error": "only GET is supported"}'
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service, host="127.0.0.1", port=8080):
+    server = await asyncio.start_server(lambda r, w: _serve_connection(service, r, w), host, port)
+    print(f"Serving salary queries on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local JSON query service over the prepared salary data.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--cache-size", type=int, default=1024, help="number of query results kept in the LRU cache")
+    parser.add_argument("--counties", default=COUNTIES_SHP, help="county shapefile")
+    parser.add_argument("--districts", default=DISTRICTS_SHP, help="school district shapefile")
+    args = parser.parse_args(argv)
+    service = SalaryService(args.counties, args.districts, args.cache_size)
+    asyncio.run(serve(service, args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Multi-year salary store partitioned by year and county.
+
+CDE publishes one J-90 extract per school year, named after the table and the
+year the school year ends (`tsal321.csv` is table 3 for 2020-21). Each extract
+is written once to Parquet under
+
+    CACHE_DIR/store/tsal3/year=2021/county=01/part.parquet
+
+and `query` reads the store with filters on year, county, step and column:
+years and counties prune whole directories, and steps and columns are pushed
+down to Parquet row-group statistics (files are sorted on them).
+
+Extracts drift between years: columns are added, dropped, renamed in case or
+change type. Column names are normalized to lower case, declared columns are
+cast to the dtypes in ingest.py, and other columns are stored as float64 when
+every value is numeric and as strings otherwise. At query time each year is
+aligned to the union of the years' schemas, with missing columns null and
+columns whose type differs between years read as strings. Years are ingested
+and read one at a time, so the full history is never in memory at once.
+
+Rows an extract cannot be stored as are reported rather than failing the
+ingest: a value in a declared numeric column that is not a number is stored
+as null, and a row without a county (the partition key) is left out. Both are
+written to a `_quality.csv` report in the year's directory, which
+`quality_report` reads back.
+
+Run `python store.py` to ingest every extract under the data directory.
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from ingest import CACHE_DIR, CATEGORY_COLUMNS, DATA_DIR, DTYPES, declared_name, file_hash
+
+STORE_DIR = CACHE_DIR / "store"
+EXTRACT_PATTERN = re.compile(r"^tsal([123])(\d\d)\.csv$")
+# Step and column fields per table; tsal1 has one row per district and neither
+STEP_COLUMNS = {"tsal1": (None, None), "tsal2": (None, "ts2_col"), "tsal3": ("ts3_step", "ts3_col")}
+ROW_GROUP_SIZE = 1 << 16
+# Per-year report of rows coerced or left out; the leading underscore keeps
+# Arrow datasets from reading it as data
+REPORT_NAME = "_quality.csv"
+REPORT_COLUMNS = ["check", "row", "cds", "field", "value"]
+COUNTY_PARTITIONING = ds.partitioning(pa.schema([("county", pa.string())]), flavor="hive")
+
+
+def find_extracts(data_dir=None):
+    """Return {(table, year): path} for every J-90 extract under `data_dir`."""
+    extracts = {}
+    for path in sorted(Path(data_dir or DATA_DIR).rglob("tsal*.csv")):
+        match = EXTRACT_PATTERN.match(path.name)
+        if match:
+            extracts[f"tsal{match[1]}", 2000 + int(match[2])] = path
+    return extracts
+
+
+def _arrow_type(dtype):
+    return pa.string() if dtype is str else pa.from_numpy_dtype(np.dtype(dtype))
+
+
+def _report(check, cds, rows, field, values):
+    # One report row per offending extract row; `row` is the 0-based data row of the extract
+    return pd.DataFrame({"check": check, "row": np.flatnonzero(rows), "cds": None if cds is None else cds[rows],
+                         "field": field, "value": values}, columns=REPORT_COLUMNS)
+
+
+def read_extract(table, year, path, report=None):
+    """Read one yearly extract as an Arrow table with normalized names and stable types.
+
+    Non-numeric values in declared numeric columns are stored as null and,
+    when a `report` list is given, appended to it as a table of those rows.
+    """
+    df = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[""])
+    df.columns = df.columns.str.strip().str.lower()
+    name = declared_name(f"{table}{year % 100:02d}")
+    declared = {col: pa.string() for col in CATEGORY_COLUMNS.get(name, [])}
+    declared.update({col: _arrow_type(dtype) for col, dtype in DTYPES.get(name, {}).items()})
+    cds = df["cds"].to_numpy(dtype=object) if "cds" in df else None
+    arrays, fields = [], []
+    for col in df.columns:
+        values = df[col].str.strip()
+        if col in declared:
+            type_ = declared[col]
+            if pa.types.is_integer(type_) or pa.types.is_floating(type_):
+                numeric = pd.to_numeric(values, errors="coerce")
+                coerced = (numeric.isna() & values.notna()).to_numpy()
+                if report is not None and coerced.any():
+                    report.append(_report("non_numeric", cds, coerced, col, values[coerced].to_numpy(dtype=object)))
+                values = numeric
+        else:
+            numeric = pd.to_numeric(values, errors="coerce")
+            if numeric.notna().sum() == values.notna().sum():
+                values, type_ = numeric.astype("float64"), pa.float64()
+            else:
+                type_ = pa.string()
+        arrays.append(pa.array(values.to_numpy(dtype=object), type=type_, from_pandas=True))
+        fields.append(pa.field(col, type_))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def _manifest_path(store_dir):
+    return Path(store_dir) / "manifest.json"
+
+
+def read_manifest(store_dir=None):
+    """{table: {year: source hash}} of every extract in the store."""
+    path = _manifest_path(store_dir or STORE_DIR)
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(manifest, store_dir):
+    path = _manifest_path(store_dir)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def write_year(table, year, path, store_dir=None):
+    """Write one extract to the store, one Parquet file per county; returns its quality report."""
+    store_dir = Path(store_dir or STORE_DIR)
+    report = []
+    data = read_extract(table, year, path, report)
+    no_county = data["county"].is_null().to_numpy(zero_copy_only=False)
+    if no_county.any():
+        cds = data["cds"].to_numpy(zero_copy_only=False) if "cds" in data.column_names else None
+        report.append(_report("missing_county", cds, no_county, "county", None))
+        data = data.filter(pa.array(~no_county))
+    report = pd.concat(report, ignore_index=True) if report else pd.DataFrame(columns=REPORT_COLUMNS)
+    step, column = STEP_COLUMNS[table]
+    sort_keys = [(col, "ascending") for col in ("county", step, column) if col]
+    data = data.take(pc.sort_indices(data, sort_keys=sort_keys))
+    target = store_dir / table / f"year={year}"
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    counties = data["county"].to_pandas()
+    for county, rows in counties.groupby(counties, sort=True).indices.items():
+        part = tmp / f"county={county}"
+        part.mkdir(parents=True)
+        pq.write_table(data.take(pa.array(rows)).drop(["county"]), part / "part.parquet",
+                       row_group_size=ROW_GROUP_SIZE)
+    tmp.mkdir(parents=True, exist_ok=True)
+    report.to_csv(tmp / REPORT_NAME, index=False)
+    if target.exists():
+        shutil.rmtree(target)
+    os.replace(tmp, target)
+    return report
+
+
+def ingest_all(data_dir=None, store_dir=None):
+    """Write every extract whose source changed since it was stored; returns the (table, year)s written."""
+    store_dir = Path(store_dir or STORE_DIR)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(store_dir)
+    written = []
+    for (table, year), path in find_extracts(data_dir).items():
+        source_hash = file_hash(path)
+        if manifest.get(table, {}).get(str(year)) == source_hash:
+            continue
+        write_year(table, year, path, store_dir)
+        manifest.setdefault(table, {})[str(year)] = source_hash
+        _write_manifest(manifest, store_dir)
+        written.append((table, year))
+    return written
+
+
+def stored_years(table, store_dir=None):
+    return sorted(int(year) for year in read_manifest(store_dir).get(table, {}))
+
+
+def quality_report(table, years=None, store_dir=None):
+    """Rows of the stored extracts that were coerced to null or left out, with a `year` column."""
+    store_dir = Path(store_dir or STORE_DIR)
+    reports = []
+    for year in stored_years(table, store_dir):
+        path = store_dir / table / f"year={year}" / REPORT_NAME
+        if (years is None or year in years) and path.exists():
+            report = pd.read_csv(path, dtype={"cds": str, "field": str, "value": str}, keep_default_na=False,
+                                 na_values=[""])
+            reports.append(report.assign(year=year)[["year"] + REPORT_COLUMNS])
+    return pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=["year"] + REPORT_COLUMNS)
+
+
+def stored_counties(table, year, store_dir=None):
+    """Counties with a partition of `table` for `year`, from the directory names alone."""
+    directory = Path(store_dir or STORE_DIR) / table / f"year={year}"
+    return sorted(part.name.split("=", 1)[1] for part in directory.glob("county=*"))
+
+
+def _year_dataset(table, year, store_dir):
+    return ds.dataset(Path(store_dir) / table / f"year={year}", format="parquet", partitioning=COUNTY_PARTITIONING)
+
+
+def unified_schema(table, store_dir=None, years=None):
+    """Union of the stored years' schemas, read from Parquet footers only.
+
+    Columns whose type differs between years are strings; `year` and `county`
+    come first.
+    """
+    store_dir = store_dir or STORE_DIR
+    types = {}
+    for year in years or stored_years(table, store_dir):
+        for field in _year_dataset(table, year, store_dir).schema:
+            if types.setdefault(field.name, field.type) != field.type:
+                types[field.name] = pa.string()
+    types.pop("county", None)
+    return pa.schema([("year", pa.int16()), ("county", pa.string())] + list(types.items()))
+
+
+def _filter(table, counties, steps, columns):
+    step, column = STEP_COLUMNS[table]
+    expression = None
+    for field, values in (("county", counties), (step, steps), (column, columns)):
+        if values is None:
+            continue
+        if field is None:
+            raise ValueError(f"{table} has no step or column to filter on")
+        condition = ds.field(field).isin(list(values))
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def scan(table, years=None, counties=None, steps=None, columns=None, fields=None, store_dir=None):
+    """Yield record batches of `table`, aligned to its unified schema, one year at a time.
+
+    Only the partitions of the requested years and counties are opened, and
+    only the requested `fields` are read.
+    """
+    store_dir = store_dir or STORE_DIR
+    stored = stored_years(table, store_dir)
+    wanted = [year for year in stored if years is None or year in years]
+    schema = unified_schema(table, store_dir, stored)
+    if fields is not None:
+        schema = pa.schema([schema.field(name) for name in fields])
+    expression = _filter(table, None if counties is None else [str(c).zfill(2) for c in counties], steps, columns)
+    for year in wanted:
+        dataset = _year_dataset(table, year, store_dir)
+        present = set(dataset.schema.names)
+        read = [name for name in schema.names if name in present]
+        for batch in dataset.to_batches(columns=read, filter=expression):
+            arrays = []
+            for field in schema:
+                if field.name == "year":
+                    arrays.append(pa.array(np.full(batch.num_rows, year, dtype=np.int16)))
+                elif field.name in present:
+                    arrays.append(batch.column(read.index(field.name)).cast(field.type))
+                else:
+                    arrays.append(pa.nulls(batch.num_rows, field.type))
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def query(table, years=None, counties=None, steps=None, columns=None, fields=None, store_dir=None):
+    """Return the matching rows of `table` as a DataFrame with identifier columns as categoricals."""
+    batches = list(scan(table, years, counties, steps, columns, fields, store_dir))
+    schema = batches[0].schema if batches else unified_schema(table, store_dir)
+    df = pa.Table.from_batches(batches, schema=schema).to_pandas()
+    for col in CATEGORY_COLUMNS.get(declared_name(f"{table}21"), []):
+        if col in df:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest every yearly J-90 extract into the partitioned store.")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="directory searched for tsal*.csv extracts")
+    parser.add_argument("--store-dir", default=STORE_DIR, help="where the partitioned store is written")
+    args = parser.parse_args(argv)
+    for table, year in ingest_all(args.data_dir, args.store_dir):
+        report = quality_report(table, [year], args.store_dir)
+        counts = ", ".join(f"{n} {check}" for check, n in report["check"].value_counts().sort_index().items())
+        print(f"{table} {year} stored" + (f" ({counts} rows reported in {REPORT_NAME})" if counts else ""))
+    for table in sorted(read_manifest(args.store_dir)):
+        print(f"{table}: {', '.join(map(str, stored_years(table, args.store_dir)))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Streaming salary summaries with memory bounded by the number of groups.
+
+Instead of loading a whole `tsal321`-style extract and joining it to the
+education classes, `summarize_stream` reads the salary rows in chunks, joins
+and filters each chunk, summarizes it with `aggregate.summarize` and folds the
+result into a running per-group table of counts, sums, minima, maxima and
+weighted sums. Only that table, the education classes and the tsal121 weights
+(one row per district column and per district) are ever held in full. Districts
+with duplicate (step, column) keys are left out, as in the pipeline (see
+quality.py). They are found by a first chunked pass over the key columns
+alone, one county at a time, which keeps one 8-byte hash per distinct
+(cds, step, column) schedule cell of the county being read rather than the
+rows. Extracts are read in CDE's cds order, which keeps each county's rows
+together; an extract that does not is rejected (ingest it into the store and
+stream it with `--years` instead).
+
+Percentiles need every salary of a group and cannot be streamed; everything
+else `summarize` computes can. The result has the same columns as
+`summarize`, so `aggregate.rank_statistic` ranks it as usual.
+
+    python stream.py data/tsal321.csv --by county --out summary-county.arrow
+    python stream.py --years 2019 2020 2021 --by cds --out summary-district.arrow
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import store
+from aggregate import GROUP_KEYS, QUANTILES, STATISTICS, WEIGHTS, summarize
+from education import classify_columns, join_classes
+from ingest import DATA_DIR, csv_dtypes, load_table, write_arrow
+
+STREAMABLE = tuple(name for name in STATISTICS if name not in QUANTILES)
+CHUNK_ROWS = 100_000
+KEY_COLUMNS = ["cds", "ts3_step", "ts3_col"]
+
+
+class DuplicateKeys:
+    """Districts with several salaries for one (step, column), found chunk by chunk.
+
+    Chunks need only the key columns. Keys seen so far are kept as a sorted
+    array of their 64-bit hashes.
+    """
+
+    def __init__(self):
+        self.seen = np.array([], dtype=np.uint64)
+        self.cds = set()
+
+    def add(self, chunk):
+        hashed = pd.util.hash_pandas_object(chunk[KEY_COLUMNS].astype({"cds": str}), index=False).to_numpy()
+        position = np.minimum(np.searchsorted(self.seen, hashed), max(len(self.seen) - 1, 0))
+        seen = self.seen[position] == hashed if len(self.seen) else np.zeros(len(hashed), dtype=bool)
+        repeated = seen | pd.Series(hashed).duplicated(keep=False).to_numpy()
+        self.cds.update(chunk["cds"].astype(str).to_numpy()[repeated])
+        # Both runs are sorted, so the stable sort is a linear merge
+        self.seen = np.sort(np.concatenate([self.seen, np.unique(hashed[~seen])]), kind="stable")
+        return self
+
+
+def _runs(values):
+    # (value, start, stop) of every run of equal values
+    starts = np.flatnonzero(values[1:] != values[:-1]) + 1
+    return zip(values[np.r_[0, starts]], np.r_[0, starts], np.r_[starts, len(values)])
+
+
+def duplicate_cds(chunks, grouped_by=None):
+    """Sorted districts with duplicate keys in an iterable of key-column chunks.
+
+    With `grouped_by` (e.g. "county") the chunks must hold the rows of each
+    value of that column together, and keys are only kept for the group being
+    read. A group that comes back after another one is a ValueError.
+    """
+    found, finished = set(), set()
+    duplicates, current = DuplicateKeys(), None
+    for chunk in chunks:
+        if grouped_by is None:
+            duplicates.add(chunk)
+            continue
+        for value, start, stop in _runs(chunk[grouped_by].astype(str).to_numpy()) if len(chunk) else ():
+            if value != current:
+                if value in finished:
+                    raise ValueError(f"rows of {grouped_by} {value} are not together; stream them from the store")
+                if current is not None:
+                    finished.add(current)
+                found |= duplicates.cds
+                duplicates, current = DuplicateKeys(), value
+            duplicates.add(chunk.iloc[start:stop])
+    return sorted(found | duplicates.cds)
+
+
+class RunningSummary:
+    """Per-group aggregates that chunk summaries are folded into."""
+
+    def __init__(self, by, statistics=STREAMABLE):
+        unsupported = [name for name in statistics if name not in STREAMABLE]
+        if unsupported:
+            raise ValueError(f"{', '.join(unsupported)} cannot be computed from a stream")
+        self.by = by
+        self.statistics = tuple(statistics)
+        self.keys = [by] + GROUP_KEYS
+        self.totals = None
+
+    def _reductions(self, columns):
+        return {col: "min" if col == "min" else "max" if col == "max" else "sum"
+                for col in columns if col not in self.keys and col not in ("mean", *WEIGHTS)}
+
+    def add(self, chunk_summary):
+        """Fold a `summarize` table of one chunk into the running totals."""
+        combined = chunk_summary if self.totals is None else pd.concat([self.totals, chunk_summary], ignore_index=True)
+        reductions = self._reductions(combined.columns)
+        self.totals = combined[self.keys + list(reductions)].groupby(
+            self.keys, observed=True, sort=False, as_index=False).agg(reductions)
+
+    def result(self):
+        """The running totals as a `summarize` table, sorted by group."""
+        if self.totals is None:
+            return pd.DataFrame(columns=self.keys + ["count", "sum"])
+        summary = self.totals.sort_values(self.keys, ignore_index=True)
+        if "mean" in self.statistics:
+            summary["mean"] = summary["sum"] / summary["count"]
+        for name in WEIGHTS:
+            if name in self.statistics:
+                prefix = name.replace("_weighted_mean", "")
+                summary[name] = summary[f"{prefix}_sum"] / summary[f"{prefix}_weight"]
+        # Same column order as `summarize`
+        order = ["count", "sum", "mean", "min", "max"]
+        for name in WEIGHTS:
+            prefix = name.replace("_weighted_mean", "")
+            order += [f"{prefix}_sum", f"{prefix}_weight", name]
+        return summary[self.keys + [col for col in order if col in summary]]
+
+
+def csv_chunks(path, chunk_rows=CHUNK_ROWS):
+    """Read a tsal321-style extract in chunks with its declared dtypes."""
+    name = Path(path).stem
+    yield from pd.read_csv(path, dtype=csv_dtypes(name), chunksize=chunk_rows)
+
+
+def summarize_stream(chunks, education_classes, by, tsal121=None, statistics=STREAMABLE, steps=None, classes=None,
+                     excluded=()):
+    """`summarize` over an iterable of tsal321 chunks, keeping only per-group totals in memory.
+
+    Each chunk is joined to `education_classes`, leaving out `excluded`
+    districts, and optionally limited to `steps` and education `classes`
+    before it is summarized.
+    """
+    running = RunningSummary(by, statistics)
+    if tsal121 is not None:
+        # Only the weights are needed, and only once per district
+        tsal121 = tsal121[["cds"] + [col for name, col in WEIGHTS.items() if name in statistics]]
+    for chunk in chunks:
+        teacher_salary = join_classes(chunk, education_classes, excluded).dropna(subset=["salary", "education_class"])
+        if steps is not None:
+            teacher_salary = teacher_salary[teacher_salary["years_experience"].isin(steps)]
+        if classes is not None:
+            teacher_salary = teacher_salary[teacher_salary["education_class"].isin(classes)]
+        if len(teacher_salary):
+            running.add(summarize(teacher_salary, by, tsal121, statistics))
+    return running.result()
+
+
+def summarize_csv(path, by, statistics=STREAMABLE, chunk_rows=CHUNK_ROWS, steps=None, classes=None):
+    """Stream one tsal321 extract against the tsal221 and tsal121 of the same directory."""
+    path = Path(path)
+    year = path.stem[5:]
+    tsal121 = load_table(f"tsal1{year}", path.parent) if any(name in WEIGHTS for name in statistics) else None
+    education_classes = classify_columns(load_table(f"tsal2{year}", path.parent))
+    key_chunks = pd.read_csv(path, usecols=["county"] + KEY_COLUMNS, dtype=csv_dtypes(path.stem), chunksize=chunk_rows)
+    excluded = duplicate_cds(key_chunks, grouped_by="county")
+    return summarize_stream(csv_chunks(path, chunk_rows), education_classes, by, tsal121, statistics, steps, classes,
+                            excluded)
+
+
+def summarize_years(years, by, statistics=STREAMABLE, steps=None, classes=None):
+    """Stream several years out of the multi-year store, one year and one batch at a time.
+
+    Returns the per-year summaries stacked with a `year` column.
+    """
+    summaries = []
+    for year in years:
+        tsal121 = store.query("tsal1", years=[year]) if any(name in WEIGHTS for name in statistics) else None
+        education_classes = classify_columns(store.query("tsal2", years=[year]))
+        # A district lies in one county, so its keys are checked one county at a time
+        excluded = sorted(cds for county in store.stored_counties("tsal3", year) for cds in duplicate_cds(
+            batch.to_pandas() for batch in store.scan("tsal3", years=[year], counties=[county], fields=KEY_COLUMNS)))
+        batches = (batch.to_pandas() for batch in store.scan("tsal3", years=[year], steps=steps))
+        summary = summarize_stream(batches, education_classes, by, tsal121, statistics, steps, classes, excluded)
+        summary.insert(0, "year", year)
+        summaries.append(summary)
+    return pd.concat(summaries, ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize salaries from a stream of chunks.")
+    parser.add_argument("source", nargs="?", default=DATA_DIR / "tsal321.csv", help="tsal321-style extract to stream")
+    parser.add_argument("--years", nargs="+", type=int, help="stream these years from the multi-year store instead")
+    parser.add_argument("--by", choices=["county", "cds"], default="cds", help="group by county or district")
+    parser.add_argument("--statistics", nargs="+", choices=STREAMABLE, default=list(STREAMABLE))
+    parser.add_argument("--steps", nargs="+", type=int, help="only these steps")
+    parser.add_argument("--classes", nargs="+", help="only these education classes")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows read per chunk")
+    parser.add_argument("--out", required=True, help="Arrow file the summary is written to")
+    args = parser.parse_args(argv)
+    if args.years:
+        store.ingest_all()
+        summary = summarize_years(args.years, args.by, args.statistics, args.steps, args.classes)
+    else:
+        summary = summarize_csv(args.source, args.by, args.statistics, args.chunk_rows, args.steps, args.classes)
+    write_arrow(summary, args.out)
+    print(f"{len(summary)} groups written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
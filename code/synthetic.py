@@ -0,0 +1,308 @@
+"""Deterministic synthetic CDE tables and shapefiles for load testing.
+
+Writes `tsal1YY.csv`, `tsal2YY.csv` and `tsal3YY.csv` for every requested
+school year, with the columns, quoting and value ranges of the real J-90
+extracts, plus county and school district shapefiles whose polygons match the
+generated counties and CDS codes. The output directory is laid out like
+`data`, so pointing `CA_SALARY_DATA` at it runs every script on it:
+
+    python synthetic.py --out-dir synthetic --districts 5000 --years 3
+    CA_SALARY_DATA=synthetic python pipeline.py
+
+Counties tile a grid over California's extent and every county's districts
+tile its cell. All borders are drawn through one shared, jittered lattice of
+vertices, so neighbouring polygons share their borders exactly, as they do in
+the real shapefiles, and `--edge-vertices` sets how detailed they are.
+
+Schedules are monotonic in step and column and grow a little every year.
+`--duplicates` districts get a repeated (step, column) salary, as Browns
+Elementary did, so the data-quality checks have something to find. The same
+seed and options give the same tables.
+"""
+
+import argparse
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import shapely
+
+# Counties in CDS order; numbers beyond these get placeholder names
+COUNTY_NAMES = [
+    "Alameda", "Alpine", "Amador", "Butte", "Calaveras", "Colusa", "Contra Costa", "Del Norte", "El Dorado",
+    "Fresno", "Glenn", "Humboldt", "Imperial", "Inyo", "Kern", "Kings", "Lake", "Lassen", "Los Angeles", "Madera",
+    "Marin", "Mariposa", "Mendocino", "Merced", "Modoc", "Mono", "Monterey", "Napa", "Nevada", "Orange", "Placer",
+    "Plumas", "Riverside", "Sacramento", "San Benito", "San Bernardino", "San Diego", "San Francisco",
+    "San Joaquin", "San Luis Obispo", "San Mateo", "Santa Barbara", "Santa Clara", "Santa Cruz", "Shasta",
+    "Sierra", "Siskiyou", "Solano", "Sonoma", "Stanislaus", "Sutter", "Tehama", "Trinity", "Tulare", "Tuolumne",
+    "Ventura", "Yolo", "Yuba",
+]
+# (west, south, east, north) the county grid is laid over
+CA_EXTENT = (-124.4, 32.5, -114.1, 42.0)
+# ts1_type codes with their share of real districts and the name suffix they get
+DISTRICT_TYPES = {1: (0.47, "Elementary"), 4: (0.39, "Unified"), 2: (0.08, "Union High"),
+                  0: (0.05, "County Office of Education"), 9: (0.01, "Unified")}
+NAME_PARTS = (["Oak", "Pine", "Cedar", "River", "Lake", "Hill", "Mesa", "Sierra", "Valley", "Vista", "Grove", "Bay",
+               "Canyon", "Ridge", "Meadow", "Spring", "Sunset", "Willow", "Mountain", "Harbor"],
+              ["view", "dale", "wood", "field", "port", "crest", "land", "brook", "ton", "side"])
+
+# tsal121 columns in extract order: text columns are quoted, the others numeric
+TSAL121_COLUMNS = {
+    "county": "text", "district": "text", "cds": "text", "ts1_dname": "text", "ts1_county": "text",
+    "ts1_type": "text", "ts1_ada": "float", "ts1_bacol": "int", "ts1_pctchg": "float", "ts1_ndays": "int",
+    "ts1_rdays": "int", "ts1_hstep": "int", "ts1_hcol": "int", "ts1_minsal": "int", "ts1_maxsal": "int",
+    "ts1_totfte": "float", "ts1_couns": "text", "ts1_nurse": "text", "ts1_psych": "text", "ts1_libra": "text",
+    "ts1_mbonam": "float", "ts1_mbonft": "float", "ts1_dbonam": "float", "ts1_dbonft": "float",
+    "ts1_sebona": "float", "ts1_sebonf": "float", "ts1_bbonam": "float", "ts1_bbonft": "float",
+    "ts1_o1bona": "float", "ts1_o1bonf": "float", "ts1_o1desc": "text", "ts1_o2bona": "float",
+    "ts1_o2bonf": "float", "ts1_o2desc": "text", "ts1_o3bona": "float", "ts1_o3bonf": "float",
+    "ts1_o3desc": "text", "ts1_o4bona": "float", "ts1_o4bonf": "float", "ts1_o4desc": "text",
+    "ts1_prine": "float", "ts1_prinm": "float", "ts1_prinh": "float", "ts1_supt": "float", "ts1_dprine": "int",
+    "ts1_dprinm": "int", "ts1_dprinh": "float", "ts1_dissup": "float", "ts1_pctsup": "float",
+    "ts1_effdat": "text", "ts1_note": "text", "ts1_conf": "text", "ts1_maxcaf": "int", "ts1_maxsin": "int",
+    "ts1_maxtwo": "int", "ts1_maxthree": "int", "ts1_maxfam": "int", "ts1_captype": "text", "printed": "text",
+    "lastcol": "int", "note2_1": "text", "note2_2": "text", "note3_1": "text", "note3_2": "text",
+    "note4_1": "text", "note4_2": "text", "other_plan": "int", "ben_life": "text", "ben_stop": "int",
+    "maxbonpct": "float", "h_plan": "int", "d_plan": "int", "v_plan": "int", "l_plan": "int", "o_plan": "int",
+    "axbonusa": "float", "axbonusp": "float", "retroact": "text", "included": "text", "ts1_cbonam": "float",
+    "ts1_cbonft": "float", "ts1_bcbona": "float", "ts1_bcbonf": "float", "ts1_nbonam": "float",
+    "ts1_nbonft": "float", "estep": "int", "ecol": "int", "ssamt": "float", "note5_1": "text", "colhead": "text",
+    "efte": "float", "sshr": "float", "ssday": "float", "charter": "text", "chtfte": "float", "r_other": "int",
+    "ur_other": "int", "retire": "int", "uretire": "int", "bonusapp": "text", "liability": "float",
+    "studydate": "text", "ba30col": "int", "tsal1_ts": "text",
+}
+TSAL221_TEXT = {"county", "district", "cds", "ts2_col1", "ts2_col1a", "ts2_col2", "ts2_col3", "ts2_col3a"}
+TSAL321_TEXT = {"county", "district", "cds"}
+YES_NO_COLUMNS = ["ts1_couns", "ts1_nurse", "ts1_psych", "ts1_libra", "printed", "retroact", "included",
+                  "charter", "bonusapp"]
+
+
+def generate_districts(rng, n_districts, n_counties, max_steps, max_columns):
+    """One row per district: its county, CDS code, type, name and salary schedule parameters."""
+    if n_districts < n_counties:
+        raise ValueError("need at least one district per county")
+    per_county = 1 + rng.multinomial(n_districts - n_counties, rng.dirichlet(np.full(n_counties, 2.0)))
+    county = np.repeat(np.arange(1, n_counties + 1), per_county)
+    number = np.concatenate([np.sort(rng.choice(np.arange(10000, 100000), n, replace=False)) for n in per_county])
+    codes = list(DISTRICT_TYPES)
+    district_type = rng.choice(codes, n_districts, p=[DISTRICT_TYPES[code][0] for code in codes])
+    first, second = NAME_PARTS
+    names = (np.asarray(first)[rng.integers(len(first), size=n_districts)] +
+             np.asarray(second)[rng.integers(len(second), size=n_districts)] + " " +
+             np.asarray([DISTRICT_TYPES[code][1] for code in codes])[
+                 pd.Index(codes).get_indexer(district_type)])
+    return pd.DataFrame({
+        "county": [f"{c:02d}" for c in county],
+        "district": [f"{n:05d}" for n in number],
+        "cds": [f"{c:02d}{n:05d}" for c, n in zip(county, number)],
+        "name": names,
+        "type": district_type,
+        # Position of the district within its county's grid cell
+        "cell": np.concatenate([np.arange(n) for n in per_county]),
+        "steps": rng.integers(max(1, max_steps // 3), max_steps + 1, n_districts),
+        "columns": rng.integers(max(1, max_columns // 2), max_columns + 1, n_districts),
+        "base": np.maximum(rng.normal(50000, 6000, n_districts), 30000),
+        "step_raise": rng.uniform(0.02, 0.04, n_districts),
+        "column_raise": rng.uniform(1500, 3500, n_districts),
+        "yearly_raise": rng.uniform(0.0, 0.05, n_districts),
+        "ada": np.round(rng.lognormal(7.7, 1.6, n_districts), 2),
+    })
+
+
+def _county_name(number):
+    return COUNTY_NAMES[number - 1] if number <= len(COUNTY_NAMES) else f"County {number}"
+
+
+def _columns(districts):
+    """(district row, column) for every schedule column."""
+    row = np.repeat(np.arange(len(districts)), districts["columns"].to_numpy())
+    start = np.repeat(np.cumsum(districts["columns"].to_numpy()) - districts["columns"].to_numpy(),
+                      districts["columns"].to_numpy())
+    return row, np.arange(len(row)) - start + 1
+
+
+def tsal221_table(districts, rng):
+    """Column descriptions: BA plus 15 units a column, some with an MA alternative or a doctorate last."""
+    row, column = _columns(districts)
+    last = column == districts["columns"].to_numpy()[row]
+    units = 15 * (column - 1)
+    col1 = np.where(units > 0, "BA+" + units.astype(str), "BA")
+    roll = rng.random(len(row))
+    col1 = np.where((column == 1) & (roll < 0.05), "EMERG/  ", col1)
+    col1 = np.where(last & (column > 3) & (roll > 0.9), "BA+" + units.astype(str) + "+PHD", col1)
+    col1a = np.where((units >= 30) & (roll < 0.3), "OR", "")
+    col2 = np.where(col1a == "OR", "MA" + np.where(units > 30, "+" + (units - 30).astype(str), ""), "")
+    col1a = np.where((column == 1) & (roll < 0.05), "INTERN", col1a)
+    return pd.DataFrame({
+        "county": districts["county"].to_numpy()[row], "district": districts["district"].to_numpy()[row],
+        "cds": districts["cds"].to_numpy()[row], "ts2_col": column,
+        "ts2_col1": col1, "ts2_col1a": col1a, "ts2_col2": col2, "ts2_col3": "", "ts2_col3a": "",
+        "ts2_id": np.arange(1, len(row) + 1),
+    })
+
+
+def tsal321_table(districts, year_index, duplicated=()):
+    """Salaries for every (district, step, column), rounded to dollars and rising with step and column.
+
+    The `duplicated` district rows get a second, slightly higher salary at step 1.
+    """
+    steps, columns = districts["steps"].to_numpy(), districts["columns"].to_numpy()
+    cells = steps * columns
+    row = np.repeat(np.arange(len(districts)), cells)
+    offset = np.arange(len(row)) - np.repeat(np.cumsum(cells) - cells, cells)
+    step, column = offset // columns[row] + 1, offset % columns[row] + 1
+    base = districts["base"].to_numpy() * (1 + districts["yearly_raise"].to_numpy()) ** year_index
+    salary = np.round(base[row] * (1 + districts["step_raise"].to_numpy()[row]) ** (step - 1) +
+                      districts["column_raise"].to_numpy()[row] * (column - 1))
+    table = pd.DataFrame({
+        "county": districts["county"].to_numpy()[row], "district": districts["district"].to_numpy()[row],
+        "cds": districts["cds"].to_numpy()[row], "ts3_step": step, "ts3_col": column, "ts3_salary": salary,
+    })
+    if len(duplicated):
+        extra = table[np.isin(row, duplicated) & (step == 1)].assign(ts3_salary=lambda df: df["ts3_salary"] + 500)
+        table = pd.concat([table, extra]).sort_index(kind="stable")
+    return table.assign(ts3_id=np.arange(1, len(table) + 1)).reset_index(drop=True)
+
+
+def tsal121_table(districts, tsal321, year, rng):
+    """District records: the fields the maps use drawn from realistic ranges, the rest left empty."""
+    n = len(districts)
+    salaries = tsal321.groupby("cds", sort=False)["ts3_salary"].agg(["min", "max"]).reindex(districts["cds"])
+    single = np.where(rng.random(n) < 0.3, 0, rng.uniform(6000, 15000, n)).round()
+    table = {}
+    for column, kind in TSAL121_COLUMNS.items():
+        table[column] = np.full(n, "", dtype=object) if kind == "text" else np.zeros(n, dtype=kind)
+    table.update({
+        "county": districts["county"].to_numpy(), "district": districts["district"].to_numpy(),
+        "cds": districts["cds"].to_numpy(), "ts1_dname": districts["name"].str.upper().to_numpy(),
+        "ts1_county": [_county_name(int(c)) for c in districts["county"]],
+        "ts1_type": districts["type"].astype(str).to_numpy(), "ts1_ada": districts["ada"].to_numpy(),
+        "ts1_bacol": np.ones(n, dtype=int), "ts1_pctchg": np.round(districts["yearly_raise"].to_numpy() * 100, 2),
+        "ts1_ndays": rng.choice([180, 182, 185], n, p=[0.8, 0.1, 0.1]),
+        "ts1_hstep": districts["steps"].to_numpy(), "ts1_hcol": districts["columns"].to_numpy(),
+        "ts1_minsal": salaries["min"].to_numpy(dtype=int), "ts1_maxsal": salaries["max"].to_numpy(dtype=int),
+        "ts1_totfte": np.round(np.maximum(districts["ada"].to_numpy() / 18, 1), 2),
+        "ts1_mbonam": np.where(rng.random(n) < 0.5, 0, rng.uniform(500, 3000, n)).round(2),
+        "ts1_dbonam": np.where(rng.random(n) < 0.6, 0, rng.uniform(1000, 4000, n)).round(2),
+        "ts1_effdat": np.full(n, f"07/01/{year - 1}"), "ts1_maxsin": single.astype(int),
+        "ts1_maxtwo": (single * 1.5).round().astype(int), "ts1_maxfam": (single * 2).round().astype(int),
+        "ts1_captype": rng.choice(["H", "S"], n, p=[0.8, 0.2]), "lastcol": districts["columns"].to_numpy(),
+        "studydate": np.full(n, f"06/30/{year}"), "tsal1_ts": np.full(n, f"{year}-10-21 13:06:58"),
+    })
+    table["ts1_rdays"] = table["ts1_ndays"] + 5
+    for column in YES_NO_COLUMNS:
+        table[column] = rng.choice(["Y", "N"], n)
+    return pd.DataFrame(table)[list(TSAL121_COLUMNS)]
+
+
+def write_extract(df, path, text_columns):
+    """Write a table as the CDE extracts are: text quoted, numbers bare."""
+    arrays = [pa.array(df[col].astype(str).to_numpy() if col in text_columns else df[col].to_numpy())
+              for col in df.columns]
+    pv.write_csv(pa.Table.from_arrays(arrays, names=list(df.columns)), path,
+                 pv.WriteOptions(quoting_style="needed"))
+
+
+def _lattice(rng, shape, extent, jitter=0.3):
+    """(x, y) vertex grids of `shape` over `extent`, interior vertices jittered by a fraction of the spacing."""
+    west, south, east, north = extent
+    x, y = np.meshgrid(np.linspace(west, east, shape[0]), np.linspace(south, north, shape[1]), indexing="ij")
+    dx, dy = (east - west) / (shape[0] - 1), (north - south) / (shape[1] - 1)
+    x[1:-1, 1:-1] += rng.uniform(-jitter, jitter, (shape[0] - 2, shape[1] - 2)) * dx
+    y[1:-1, 1:-1] += rng.uniform(-jitter, jitter, (shape[0] - 2, shape[1] - 2)) * dy
+    return x, y
+
+
+def _ring(x, y, i0, j0, i1, j1):
+    """Polygon along the lattice border of the cells from vertex (i0, j0) to (i1, j1)."""
+    i = np.r_[np.arange(i0, i1), np.full(j1 - j0, i1), np.arange(i1, i0, -1), np.full(j1 - j0, i0)]
+    j = np.r_[np.full(i1 - i0, j0), np.arange(j0, j1), np.full(i1 - i0, j1), np.arange(j1, j0, -1)]
+    return shapely.Polygon(np.column_stack([x[i, j], y[i, j]]))
+
+
+def shapefiles(districts, n_counties, edge_vertices, rng):
+    """County and district GeoDataFrames in Web Mercator, sharing every border."""
+    grid_x = int(np.ceil(np.sqrt(n_counties)))
+    grid_y = int(np.ceil(n_counties / grid_x))
+    k = int(np.ceil(np.sqrt(districts.groupby("county").size().max())))
+    m = edge_vertices
+    x, y = _lattice(rng, (grid_x * k * m + 1, grid_y * k * m + 1), CA_EXTENT)
+
+    county_rows = []
+    for number in range(1, n_counties + 1):
+        ci, cj = (number - 1) % grid_x, (number - 1) // grid_x
+        county_rows.append((_county_name(number), number, None,
+                            _ring(x, y, ci * k * m, cj * k * m, (ci + 1) * k * m, (cj + 1) * k * m)))
+    # A few islands off the coast, which the maps leave out
+    west, south = CA_EXTENT[:2]
+    for number in range(1, max(1, n_counties // 10) + 1):
+        county_rows.append((_county_name(number), number, "Y",
+                            shapely.box(west - 1.0, south + number * 0.3, west - 0.8, south + number * 0.3 + 0.15)))
+    counties = gpd.GeoDataFrame(county_rows, columns=["COUNTY_NAM", "COUNTY_NUM", "ISLAND", "geometry"],
+                                crs="EPSG:4326")
+
+    county = districts["county"].astype(int).to_numpy() - 1
+    i0 = ((county % grid_x) * k + districts["cell"].to_numpy() % k) * m
+    j0 = ((county // grid_x) * k + districts["cell"].to_numpy() // k) * m
+    geometry = [_ring(x, y, i, j, i + m, j + m) for i, j in zip(i0, j0)]
+    district_layer = gpd.GeoDataFrame({"CDCode": districts["cds"], "DistrictNa": districts["name"]},
+                                      geometry=geometry, crs="EPSG:4326")
+    return counties.to_crs("EPSG:3857"), district_layer.to_crs("EPSG:3857")
+
+
+def generate(out_dir, n_districts=1000, n_counties=58, max_steps=30, max_columns=8, years=1, end_year=2021,
+             edge_vertices=4, duplicates=1, seed=0):
+    """Write the synthetic extracts and shapefiles to `out_dir`; returns the paths written."""
+    rng = np.random.default_rng(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    districts = generate_districts(rng, n_districts, n_counties, max_steps, max_columns)
+    tsal221 = tsal221_table(districts, rng)
+    duplicated = rng.choice(len(districts), min(duplicates, len(districts)), replace=False)
+    text121 = {col for col, kind in TSAL121_COLUMNS.items() if kind == "text"}
+    paths = []
+    for year_index, year in enumerate(range(end_year - years + 1, end_year + 1)):
+        suffix = f"{year % 100:02d}"
+        tsal321 = tsal321_table(districts, year_index, duplicated)
+        tables = [(f"tsal1{suffix}", tsal121_table(districts, tsal321, year, rng), text121),
+                  (f"tsal2{suffix}", tsal221, TSAL221_TEXT),
+                  (f"tsal3{suffix}", tsal321, TSAL321_TEXT)]
+        for name, table, text_columns in tables:
+            path = out_dir / f"{name}.csv"
+            write_extract(table, path, text_columns)
+            paths.append(path)
+
+    counties, district_layer = shapefiles(districts, n_counties, edge_vertices, rng)
+    for layer, path in ((counties, out_dir / "ca_counties" / "cnty19_1.shp"),
+                        (district_layer, out_dir / "ca_school_districts" /
+                         "California_School_District_Areas_2020-21.shp")):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        layer.to_file(path)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic CDE tables and shapefiles for load testing.")
+    parser.add_argument("--out-dir", default="synthetic", help="directory laid out like data/")
+    parser.add_argument("--districts", type=int, default=1000, help="number of school districts")
+    parser.add_argument("--counties", type=int, default=58, help="number of counties")
+    parser.add_argument("--max-steps", type=int, default=30, help="most salary steps a district has")
+    parser.add_argument("--max-columns", type=int, default=8, help="most education columns a district has")
+    parser.add_argument("--years", type=int, default=1, help="school years of extracts, ending with --end-year")
+    parser.add_argument("--end-year", type=int, default=2021, help="year the last school year ends")
+    parser.add_argument("--edge-vertices", type=int, default=4, help="vertices along each district border")
+    parser.add_argument("--duplicates", type=int, default=1, help="districts with a duplicated salary")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    paths = generate(args.out_dir, args.districts, args.counties, args.max_steps, args.max_columns, args.years,
+                     args.end_year, args.edge_vertices, args.duplicates, args.seed)
+    for path in paths:
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Offline Mapbox Vector Tile pyramids for the salary map layers.
+
+Tiles are written as a plain `{z}/{x}/{y}.pbf` directory, so they can be served
+from any static host next to the map HTML with no tile server. Browsers fetch
+only the tiles in view; past `max_zoom` the deepest tiles are overzoomed.
+"""
+
+from pathlib import Path
+
+import mapbox_vector_tile
+import mercantile
+import shapely
+from branca.element import MacroElement, Template
+
+WEB_MERCATOR = "EPSG:3857"
+EXTENT = 4096
+# Tile clip buffer in tile units, so polygon outlines don't show at tile edges
+BUFFER = 64
+
+VECTORGRID_JS = "https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/Leaflet.VectorGrid.bundled.js"
+
+
+def _pick_level(levels, zoom):
+    # Finest prepared geometry that is not more detailed than the tile zoom
+    usable = [z for z in levels if z <= zoom]
+    return levels[max(usable) if usable else min(levels)]
+
+
+def build_tiles(levels, out_dir, layer_name, properties, min_zoom=5, max_zoom=10):
+    """Write a vector tile pyramid for the layer and return the number of tiles written.
+
+    `levels` maps a zoom to a GeoDataFrame of the layer prepared for that zoom
+    (see geometry.LEVELS); each tile zoom uses the closest coarser one.
+    `properties` are the columns carried into the tiles, e.g. salary, rank and
+    the formatted tooltip.
+    """
+    out_dir = Path(out_dir)
+    written = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        gdf = _pick_level(levels, zoom)
+        wgs84 = gdf.to_crs("EPSG:4326")
+        mercator = gdf.to_crs(WEB_MERCATOR)
+        geoms = mercator.geometry.values
+        records = mercator[properties].to_dict("records")
+        tree = shapely.STRtree(geoms)
+        for tile in mercantile.tiles(*wgs84.total_bounds, zooms=zoom):
+            bounds = mercantile.xy_bounds(tile)
+            pad = (bounds.right - bounds.left) * BUFFER / EXTENT
+            clip_box = shapely.box(bounds.left - pad, bounds.bottom - pad, bounds.right + pad, bounds.top + pad)
+            hits = tree.query(clip_box, predicate="intersects")
+            if len(hits) == 0:
+                continue
+            clipped = shapely.intersection(geoms[hits], clip_box)
+            features = [{"geometry": geom, "properties": records[i]}
+                        for i, geom in zip(hits, clipped) if not geom.is_empty]
+            data = mapbox_vector_tile.encode(
+                [{"name": layer_name, "features": features}],
+                default_options={"quantize_bounds": (bounds.left, bounds.bottom, bounds.right, bounds.top),
+                                 "extents": EXTENT},
+            )
+            path = out_dir / str(tile.z) / str(tile.x) / f"{tile.y}.pbf"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            written += 1
+    return written
+
+
+def vector_tile_layer(url, layer_name, max_native_zoom=10, tooltip_property="tooltip"):
+    """Return a map element that draws a tile pyramid colored by each feature's `fill_color`.
+
+    Hovering a feature highlights it and shows its `tooltip_property` HTML,
+    matching the GeoJson layers. Add it to a folium map with `m.add_child`.
+    """
+    template = """
+{% macro header(this, kwargs) %}
+<script src='""" + VECTORGRID_JS + """'></script>
+{% endmacro %}
+
+{% macro script(this, kwargs) %}
+var {{ this.get_name() }} = L.vectorGrid.protobuf('""" + url + """', {
+    rendererFactory: L.canvas.tile,
+    interactive: true,
+    maxNativeZoom: """ + str(max_native_zoom) + """,
+    getFeatureId: function(f) { return f.properties.feature_id; },
+    vectorTileLayerStyles: {
+        '""" + layer_name + """': function(properties) {
+            return {fill: true, fillColor: properties.fill_color, fillOpacity: 0.8, color: 'black', weight: 1};
+        }
+    }
+});
+var {{ this.get_name() }}_highlighted = null;
+{{ this.get_name() }}.on('mouseover', function(e) {
+    if ({{ this.get_name() }}_highlighted !== null) { {{ this.get_name() }}.resetFeatureStyle({{ this.get_name() }}_highlighted); }
+    {{ this.get_name() }}_highlighted = e.layer.properties.feature_id;
+    {{ this.get_name() }}.setFeatureStyle({{ this.get_name() }}_highlighted, {fill: true, fillColor: '#000000', color: '#000000', fillOpacity: 0.5, weight: 0.1});
+    L.popup({closeButton: false, className: 'salary-tooltip'})
+        .setLatLng(e.latlng)
+        .setContent(e.layer.properties.""" + tooltip_property + """)
+        .openOn({{ this._parent.get_name() }});
+});
+{{ this.get_name() }}.on('mouseout', function(e) {
+    if ({{ this.get_name() }}_highlighted !== null) { {{ this.get_name() }}.resetFeatureStyle({{ this.get_name() }}_highlighted); {{ this.get_name() }}_highlighted = null; }
+    {{ this._parent.get_name() }}.closePopup();
+});
+{{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+{% endmacro %}
+"""
+    macro = MacroElement()
+    macro._template = Template(template)
+    return macro
@@ -0,0 +1,31 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The modules in code/ import each other by plain name
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "code"))
+
+# Point the data and cache directories at synthetic tables before any module
+# reads them, so the tests never touch data/
+_DATA_DIR = Path(tempfile.mkdtemp(prefix="ca-salary-tests-"))
+atexit.register(shutil.rmtree, _DATA_DIR, ignore_errors=True)
+os.environ["CA_SALARY_DATA"] = str(_DATA_DIR)
+os.environ["CA_SALARY_CACHE"] = str(_DATA_DIR / "cache")
+
+SYNTHETIC_YEARS = (2020, 2021)
+
+
+@pytest.fixture(scope="session")
+def synthetic_data():
+    """Data directory with two years of synthetic extracts and shapefiles (see synthetic.py)."""
+    import synthetic
+
+    if not (_DATA_DIR / "tsal321.csv").exists():
+        synthetic.generate(_DATA_DIR, n_districts=150, n_counties=6, years=len(SYNTHETIC_YEARS),
+                           end_year=SYNTHETIC_YEARS[-1], duplicates=1, seed=0)
+    return _DATA_DIR
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregate import GROUP_KEYS, rank_statistic, summarize
+from education import EDUCATION_CLASSES
+
+
+def teacher_salary(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    cds = rng.integers(0, 40, n)
+    salary = rng.normal(50000, 8000, n).round(0)
+    salary[rng.random(n) < 0.05] = np.nan
+    return pd.DataFrame({
+        "county": pd.Categorical([f"{c // 10 + 1:02d}" for c in cds]),
+        "cds": [f"{c:07d}" for c in cds],
+        "years_experience": rng.integers(1, 6, n).astype("int16"),
+        "education_class": pd.Categorical(rng.choice(EDUCATION_CLASSES + [None], n), categories=EDUCATION_CLASSES),
+        "salary": salary,
+    })
+
+
+def tsal121(df):
+    cds = sorted(df["cds"].unique())
+    return pd.DataFrame({"cds": cds, "ts1_ada": np.arange(len(cds)) + 100.0,
+                         "ts1_totfte": np.arange(len(cds)) % 7 * 10.0})
+
+
+@pytest.mark.parametrize("by", ["county", "cds"])
+def test_summarize_matches_groupby(by):
+    df = teacher_salary()
+    summary = summarize(df, by, tsal121(df)).set_index([by] + GROUP_KEYS)
+    rows = df.dropna(subset=["salary", "education_class"])
+    grouped = rows.groupby([rows[by].astype(str), "years_experience", "education_class"], observed=True)["salary"]
+    expected = pd.DataFrame({
+        "count": grouped.count(), "sum": grouped.sum(), "mean": grouped.mean(), "min": grouped.min(),
+        "max": grouped.max(), "median": grouped.median(), "p25": grouped.quantile(0.25),
+        "p75": grouped.quantile(0.75),
+    })
+    assert len(summary) == len(expected)
+    actual = summary.loc[expected.index, expected.columns]
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_names=False, check_index_type=False)
+
+
+def test_summarize_weighted_means():
+    df = teacher_salary()
+    weights = tsal121(df)
+    summary = summarize(df, "county", weights)
+    rows = df.dropna(subset=["salary", "education_class"])
+    ada = rows["cds"].map(weights.set_index("cds")["ts1_ada"])
+    expected = ((rows["salary"] * ada).groupby([rows["county"], rows["years_experience"], rows["education_class"]],
+                                               observed=True).sum()
+                / ada.groupby([rows["county"], rows["years_experience"], rows["education_class"]],
+                              observed=True).sum())
+    actual = summary.set_index(["county"] + GROUP_KEYS)["ada_weighted_mean"]
+    np.testing.assert_allclose(actual.loc[expected.index.map(lambda k: (str(k[0]),) + k[1:])], expected)
+
+
+def test_summarize_without_weights():
+    df = teacher_salary()
+    summary = summarize(df, "county")
+    assert "ada_weighted_mean" not in summary
+    assert "fte_weighted_mean" not in summary
+    assert summary["count"].sum() == len(df.dropna(subset=["salary", "education_class"]))
+
+
+@pytest.mark.parametrize("empty", [
+    lambda df: df.iloc[:0],
+    lambda df: df.assign(education_class=pd.Categorical([None] * len(df), categories=EDUCATION_CLASSES)),
+])
+def test_summarize_empty(empty):
+    df = teacher_salary()
+    summary = summarize(empty(df), "county", tsal121(df))
+    full = summarize(df, "county", tsal121(df))
+    assert summary.empty
+    assert list(summary.columns) == list(full.columns)
+    assert summary.dtypes.equals(full.dtypes)
+
+
+def test_rank_statistic_combines_classes():
+    df = teacher_salary()
+    summary = summarize(df, "county", tsal121(df))
+    ranked = rank_statistic(summary, "county", 1, ["BA", "MA"])
+    rows = df[(df["years_experience"] == 1) & df["education_class"].isin(["BA", "MA"])].dropna(subset=["salary"])
+    expected = rows.groupby(rows["county"].astype(str), observed=True)["salary"].mean()
+    assert ranked["salary_rank"].tolist() == list(range(1, len(expected) + 1))
+    np.testing.assert_allclose(ranked.set_index("county")["salary"], expected.loc[ranked["county"]])
+    with pytest.raises(ValueError):
+        rank_statistic(summary, "county", 1, ["BA", "MA"], "median")
+
+
+def test_statistics_subset():
+    df = teacher_salary()
+    summary = summarize(df, "cds", statistics=("count", "max"))
+    assert set(summary.columns) == {"cds", *GROUP_KEYS, "count", "sum", "max"}
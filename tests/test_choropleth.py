@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from choropleth import MISSING_COLOR, PALETTE, assign_colors, class_breaks
+
+
+@pytest.mark.parametrize("scheme", ["equal_interval", "quantile", "jenks"])
+def test_class_breaks(scheme):
+    values = np.r_[np.random.default_rng(0).normal(50000, 8000, 500), np.nan]
+    bins = class_breaks(values, scheme=scheme)
+    assert len(bins) == len(PALETTE)
+    assert np.all(np.diff(bins) >= 0)
+    assert bins[0] == np.nanmin(values) and bins[-1] == np.nanmax(values)
+
+
+def test_assign_colors():
+    bins = class_breaks([0, 70])
+    colors = assign_colors([0, 35, 70, np.nan], bins)
+    assert list(colors) == [PALETTE[0], PALETTE[3], PALETTE[-1], MISSING_COLOR]
@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from education import EDUCATION_CLASSES, classify_columns, normalize_descriptions, parse_description
+from education import join_classes, load_education_classes
+from ingest import load_table
+
+# Descriptions as they appear in the 2020-21 tsal221
+DESCRIPTIONS = [
+    ("BA", "BA", 0, "NONE"),
+    ("BA+30", "BA_UNITS", 30, "NONE"),
+    ("BA+45 OR MA", "MA", 45, "NONE"),
+    ("BA+60+MA+CRED", "MA", 60, "CRED"),
+    ("MA+CRED", "MA", 0, "CRED"),
+    ("BA+45+EL AUTH OR MA+EL AUTH", "MA", 45, "NONE"),
+    ("MA+30", "MA_UNITS", 30, "NONE"),
+    ("BA+60+MA/PHD OR MA+30", "DOCTORATE", 60, "NONE"),
+    ("MA OR PHD", "DOCTORATE", 0, "NONE"),
+    ("MA+45 OR PHD", "DOCTORATE", 45, "NONE"),
+    ("BA+75+MA+PHD", "DOCTORATE", 75, "NONE"),
+    ("BA+75+MA+EDD+NBC", "DOCTORATE", 75, "NONE"),
+    ("BA+75 OR MA+15 OR PHD OR EDD", "DOCTORATE", 75, "NONE"),
+    ("BA+75+MA OR PHD CRED", "DOCTORATE", 75, "CRED"),
+    ("PHD", "DOCTORATE", 0, "NONE"),
+    ("BA+60 OR PHN+30", "BA_UNITS", 60, "NONE"),
+    ("EMERG/ INTERN", "OTHER", 0, "EMERG"),
+    ("NON-CRED", "OTHER", 0, "NON_CRED"),
+]
+
+
+@pytest.mark.parametrize("desc, education_class, units, credential", DESCRIPTIONS)
+def test_parse_description(desc, education_class, units, credential):
+    assert parse_description(desc) == (education_class, units, credential)
+
+
+def test_normalize_descriptions():
+    tsal221 = pd.DataFrame({"ts2_col1": ["ba+45  or", None], "ts2_col1a": ["ma", "phd"], "ts2_col2": [None, " "]})
+    assert normalize_descriptions(tsal221).tolist() == ["BA+45 OR MA", "PHD"]
+
+
+def test_classify_columns_matches_parse_description():
+    descs = [desc for desc, *_ in DESCRIPTIONS]
+    tsal221 = pd.DataFrame({"cds": [f"{i:07d}" for i in range(len(descs))], "ts2_col": range(len(descs)),
+                            "ts2_col1": descs, "ts2_col1a": None, "ts2_col2": None})
+    classes = classify_columns(tsal221)
+    assert list(classes["education_class"].cat.categories) == EDUCATION_CLASSES
+    assert classes["education_class"].astype(str).tolist() == [c for _, c, _, _ in DESCRIPTIONS]
+    assert classes["units"].tolist() == [u for _, _, u, _ in DESCRIPTIONS]
+
+
+def test_load_education_classes_caches_the_synthetic_tsal221(synthetic_data):
+    tsal221 = load_table("tsal221")
+    expected = classify_columns(tsal221)
+    assert expected["education_class"].notna().all()
+    # Built once, then read back from the cache
+    pd.testing.assert_frame_equal(load_education_classes(), expected)
+    pd.testing.assert_frame_equal(load_education_classes(), expected)
+
+
+def test_join_classes(synthetic_data):
+    tsal321, education_classes = load_table("tsal321"), load_education_classes()
+    excluded = [tsal321["cds"].iloc[0]]
+    joined = join_classes(tsal321, education_classes, excluded)
+    kept = tsal321[~tsal321["cds"].isin(excluded)]
+    assert len(joined) == len(kept)
+    assert list(joined.columns) == ["county", "cds", "years_experience", "education_level_column", "education_class",
+                                    "salary"]
+    classes = education_classes.set_index(["cds", "ts2_col"])["education_class"]
+    expected = classes.reindex(pd.MultiIndex.from_arrays([kept["cds"].astype(str), kept["ts3_col"]]))
+    assert joined["education_class"].astype(str).tolist() == expected.astype(str).tolist()
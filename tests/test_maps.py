@@ -0,0 +1,13 @@
+import gzip
+
+import brotli
+
+from maps import precompress
+
+
+def test_precompress_writes_gzip_and_brotli(tmp_path):
+    path = tmp_path / "map.html"
+    path.write_text("<html>" + "salary " * 1000 + "</html>")
+    precompress(path)
+    assert gzip.decompress((tmp_path / "map.html.gz").read_bytes()) == path.read_bytes()
+    assert brotli.decompress((tmp_path / "map.html.br").read_bytes()) == path.read_bytes()
@@ -0,0 +1,27 @@
+import pandas as pd
+import pytest
+
+import parallel
+from aggregate import summarize
+from education import EDUCATION_CLASSES
+from test_aggregate import teacher_salary, tsal121
+
+
+@pytest.mark.parametrize("by", ["county", "cds"])
+def test_summarize_partitioned_matches_serial(by):
+    df = teacher_salary(4000)
+    # County 01 has no classified rows, so its partition summarizes to nothing
+    df["education_class"] = pd.Categorical(df["education_class"].where(df["county"] != "01"),
+                                           categories=EDUCATION_CLASSES)
+    weights = tsal121(df)
+    expected = summarize(df, by, weights)
+    actual = parallel.summarize_partitioned(df, by, weights, workers=2)
+    assert "01" not in set(actual.get("county", []))
+    pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+
+
+def test_partition_rows_covers_every_row():
+    df = teacher_salary()
+    partitions = parallel.partition_rows(df)
+    assert list(partitions) == sorted(df["county"].astype(str).unique())
+    assert sorted(row for rows in partitions.values() for row in rows) == list(range(len(df)))
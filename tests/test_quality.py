@@ -0,0 +1,49 @@
+import geopandas as gpd
+
+import quality
+from geometry import DISTRICTS_SHP
+from ingest import load_table
+
+
+def tables():
+    return load_table("tsal121"), load_table("tsal221"), load_table("tsal321")
+
+
+def test_duplicate_keys_excludes_the_duplicated_district(synthetic_data):
+    tsal121, tsal221, tsal321 = tables()
+    duplicates = quality.duplicate_keys(tsal321)
+    counts = tsal321.groupby(["cds", "ts3_step", "ts3_col"], observed=True).size()
+    expected = counts[counts > 1]
+    assert len(duplicates) == len(expected)
+    assert set(zip(duplicates["cds"], duplicates["step"], duplicates["column"])) == set(expected.index)
+    assert quality.excluded_cds(quality.validate(tsal121, tsal221, tsal321)) == sorted(set(duplicates["cds"]))
+
+
+def test_non_monotonic_schedules(synthetic_data):
+    # Tables are memory-mapped read-only from the Arrow cache
+    tsal321 = load_table("tsal321").copy()
+    assert len(quality.non_monotonic_schedules(tsal321)) == 0
+    # A salary below the previous step's in the same column
+    row = tsal321.index[tsal321["ts3_step"] == 2][0]
+    tsal321.loc[row, "ts3_salary"] = 1
+    issues = quality.non_monotonic_schedules(tsal321)
+    assert list(zip(issues["cds"], issues["step"], issues["column"])) == [
+        (tsal321.at[row, "cds"], 2, tsal321.at[row, "ts3_col"])]
+
+
+def test_missing_columns_and_districts(synthetic_data):
+    tsal121, tsal221, tsal321 = tables()
+    dropped = tsal221.iloc[0]
+    issues = quality.missing_columns(tsal321, tsal221.iloc[1:])
+    assert list(zip(issues["cds"], issues["column"])) == [(dropped["cds"], dropped["ts2_col"])]
+
+    districts = gpd.read_file(DISTRICTS_SHP, ignore_geometry=True)
+    assert len(quality.missing_districts(districts, tsal121)) == 0
+    missing = quality.missing_districts(districts, tsal121.iloc[1:])
+    assert list(missing["cds"]) == [tsal121["cds"].iloc[0]]
+
+
+def test_validate_stacks_every_check(synthetic_data):
+    quarantine = quality.validate(*tables())
+    assert list(quarantine.columns) == ["check", "cds", "step", "column", "detail"]
+    assert set(quarantine["check"]) == {"duplicate_key"}
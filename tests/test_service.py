@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from geometry import DISTRICTS_SHP, load_layer
+from ingest import load_table
+from service import SalaryService
+
+
+@pytest.fixture(scope="module")
+def service(synthetic_data):
+    return SalaryService(cache_size=16)
+
+
+def get(service, target):
+    status, body = service.handle(target)
+    return status, json.loads(body)
+
+
+def test_salary_matches_the_cube(service):
+    tsal321 = load_table("tsal321")
+    cds, step, column, salary = tsal321[["cds", "ts3_step", "ts3_col", "ts3_salary"]].iloc[0]
+    status, body = get(service, f"/salary?cds={cds}&step={step}&column={column}")
+    assert status == 200
+    assert body["salary"] == salary
+    status, body = get(service, f"/salary?cds={cds}&step={step}&column={column}&measure=total_family")
+    assert status == 200
+    assert body["salary"] == service.cubes["total_family"].lookup(cds, step, column)
+    assert get(service, "/salary?cds=0000000&step=1&column=1") == (200, {"salary": None})
+
+
+@pytest.mark.parametrize("level, key", [("county", "county"), ("district", "cds")])
+def test_rankings_are_ranked(service, level, key):
+    status, body = get(service, f"/rankings?level={level}&step=1&classes=BA,MA")
+    assert status == 200
+    results = body["results"]
+    assert results and [row["salary_rank"] for row in results] == list(range(1, len(results) + 1))
+    salaries = [row["salary"] for row in results if row["salary"] is not None]
+    assert salaries == sorted(salaries, reverse=True)
+    assert len({row[key] for row in results}) == len(results)
+
+
+def test_rankings_within_a_county(service):
+    county = service.counties["COUNTY_NUM"].iloc[0]
+    status, body = get(service, f"/rankings?level=district&step=1&classes=MA&county={int(county)}")
+    assert status == 200
+    assert {row["cds"][:2] for row in body["results"]} == {county}
+    assert [row["county_rank"] for row in body["results"]] == list(range(1, len(body["results"]) + 1))
+
+
+def test_top_is_the_head_of_the_ranking(service):
+    _, ranking = get(service, "/rankings?level=district&step=1&classes=MA")
+    status, body = get(service, "/top?step=1&classes=MA&n=3")
+    assert status == 200
+    assert body["results"] == ranking["results"][:3]
+
+
+def test_nearby_is_within_the_radius(service):
+    centroid = load_layer(DISTRICTS_SHP, "district").geometry.iloc[0].representative_point()
+    status, body = get(service, f"/nearby?lat={centroid.y}&lon={centroid.x}&miles=30&step=1&classes=BA,MA")
+    assert status == 200
+    assert body["results"]
+    assert all(row["distance_miles"] <= 30 for row in body["results"])
+
+
+@pytest.mark.parametrize("target, status", [
+    ("/top?step=1&classes=MA&n=-1", 400),
+    ("/top?step=one&classes=MA", 400),
+    ("/top?classes=MA", 400),
+    ("/top?step=1&classes=PHD", 400),
+    ("/top?step=1&classes=MA&statistic=mode", 400),
+    ("/top?step=1&classes=BA,MA&statistic=median", 400),
+    ("/rankings?level=state&step=1&classes=MA", 400),
+    ("/salary?cds=0000000&step=1&column=1&measure=bonus", 400),
+    ("/top?step=1&classes=", 400),
+    ("/nearby?lat=nan&lon=-120&miles=5&step=1&classes=MA", 400),
+    ("/nearby?lat=37&lon=inf&miles=5&step=1&classes=MA", 400),
+    ("/nearby?lat=37&lon=-120&miles=-5&step=1&classes=MA", 400),
+    ("/unknown", 404),
+])
+def test_bad_queries(service, target, status):
+    assert get(service, target)[0] == status
+
+
+def test_blank_classes_are_reported(service):
+    assert get(service, "/top?step=1&classes=") == (400, {"error": "no education classes given in 'classes'"})
+
+
+def test_unexpected_errors_are_500(service, monkeypatch):
+    def fail(self, params):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(SalaryService.ENDPOINTS, "/top", fail)
+    service.answer.cache_clear()
+    errors = service.errors
+    assert get(service, "/top?step=1&classes=MA") == (500, {"error": "internal error"})
+    assert service.errors == errors + 1
+
+
+def test_repeated_queries_are_cached(service):
+    service.answer.cache_clear()
+    get(service, "/top?step=2&classes=MA")
+    get(service, "/top?classes=MA&step=2")
+    status, body = get(service, "/stats")
+    assert status == 200
+    assert body["cache"]["hits"] == 1 and body["cache"]["misses"] == 1
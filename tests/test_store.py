@@ -0,0 +1,76 @@
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import store
+
+
+@pytest.fixture
+def drifted(synthetic_data, tmp_path):
+    """tsal3 extracts for 2020 and 2021 whose columns drift between the years, and a store path."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    shutil.copy(synthetic_data / "tsal320.csv", data_dir)
+    tsal321 = pd.read_csv(synthetic_data / "tsal321.csv", dtype=str, keep_default_na=False)
+    # 2021 drops `district`, upper-cases `ts3_id`, turns it into text and adds a column
+    tsal321 = tsal321.drop(columns="district").rename(columns={"ts3_id": "TS3_ID"})
+    tsal321["TS3_ID"] = "id-" + tsal321["TS3_ID"]
+    tsal321["ts3_note"] = "x"
+    # And has a salary that is not a number and a row without a county
+    tsal321.loc[3, "ts3_salary"] = "n/a"
+    tsal321.loc[7, "county"] = ""
+    tsal321.to_csv(data_dir / "tsal321.csv", index=False)
+    return data_dir, tmp_path / "store", tsal321
+
+
+def test_ingest_all_is_incremental(drifted):
+    data_dir, store_dir, _ = drifted
+    assert store.ingest_all(data_dir, store_dir) == [("tsal3", 2020), ("tsal3", 2021)]
+    assert store.ingest_all(data_dir, store_dir) == []
+    assert store.stored_years("tsal3", store_dir) == [2020, 2021]
+
+
+def test_query_aligns_drifting_schemas(drifted):
+    data_dir, store_dir, tsal321 = drifted
+    store.ingest_all(data_dir, store_dir)
+    schema = store.unified_schema("tsal3", store_dir)
+    assert schema.names[:2] == ["year", "county"]
+    assert schema.field("ts3_id").type == pa.string()
+    assert schema.field("ts3_step").type == pa.int16()
+
+    df = store.query("tsal3", store_dir=store_dir)
+    by_year = df.groupby("year")
+    assert by_year["district"].count().to_dict() == {2020: by_year.size()[2020], 2021: 0}
+    assert by_year["ts3_note"].count().to_dict() == {2020: 0, 2021: len(tsal321) - 1}
+    # Type changes are read back as strings in every year
+    assert set(df.loc[df["year"] == 2021, "ts3_id"].str[:3]) == {"id-"}
+    assert df.loc[df["year"] == 2020, "ts3_id"].str.fullmatch(r"[\d.]+").all()
+
+
+def test_query_filters_partitions(drifted):
+    data_dir, store_dir, _ = drifted
+    store.ingest_all(data_dir, store_dir)
+    counties = store.stored_counties("tsal3", 2021, store_dir)
+    df = store.query("tsal3", years=[2021], counties=counties[:1], steps=[1, 2], store_dir=store_dir)
+    assert set(df["year"]) == {2021}
+    assert set(df["county"]) == {counties[0]}
+    assert set(df["ts3_step"]) == {1, 2}
+
+
+def test_quality_report(drifted):
+    data_dir, store_dir, tsal321 = drifted
+    store.ingest_all(data_dir, store_dir)
+    report = store.quality_report("tsal3", store_dir=store_dir)
+    assert report[["year", "check", "row", "field"]].values.tolist() == [
+        [2021, "non_numeric", 3, "ts3_salary"],
+        [2021, "missing_county", 7, "county"],
+    ]
+    assert report["value"].iloc[0] == "n/a" and pd.isna(report["value"].iloc[1])
+    assert list(report["cds"]) == [tsal321.at[3, "cds"], tsal321.at[7, "cds"]]
+
+    df = store.query("tsal3", years=[2021], store_dir=store_dir)
+    # The row without a county is left out, the non-numeric salary is null
+    assert len(df) == len(tsal321) - 1
+    assert df["ts3_salary"].isna().sum() == 1
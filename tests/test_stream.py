@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+import quality
+import store
+import stream
+from aggregate import summarize
+from education import classify_columns, join_classes
+from ingest import load_table
+
+
+def serial_summary(tsal121, tsal221, tsal321, by, statistics=stream.STREAMABLE):
+    excluded = quality.excluded_cds(quality.duplicate_keys(tsal321))
+    teacher_salary = join_classes(tsal321, classify_columns(tsal221), excluded)
+    return summarize(teacher_salary, by, tsal121, statistics)
+
+
+def test_duplicate_cds_spans_chunks(synthetic_data):
+    tsal321 = load_table("tsal321")
+    expected = quality.excluded_cds(quality.duplicate_keys(tsal321))
+    assert expected
+    chunks = (tsal321.iloc[start:start + 997] for start in range(0, len(tsal321), 997))
+    assert stream.duplicate_cds(chunks) == expected
+
+
+def test_duplicate_cds_by_county(synthetic_data):
+    tsal321 = load_table("tsal321")
+    expected = quality.excluded_cds(quality.duplicate_keys(tsal321))
+    chunks = (tsal321.iloc[start:start + 997] for start in range(0, len(tsal321), 997))
+    assert stream.duplicate_cds(chunks, grouped_by="county") == expected
+    # A county that comes back after another one can't be checked one county at a time
+    shuffled = tsal321.sample(frac=1, random_state=0)
+    with pytest.raises(ValueError, match="not together"):
+        stream.duplicate_cds([shuffled], grouped_by="county")
+
+
+@pytest.mark.parametrize("by", ["county", "cds"])
+def test_summarize_csv_matches_serial(synthetic_data, by):
+    expected = serial_summary(load_table("tsal121"), load_table("tsal221"), load_table("tsal321"), by)
+    actual = stream.summarize_csv(synthetic_data / "tsal321.csv", by, chunk_rows=5000)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_categorical=False)
+
+
+def test_summarize_years_matches_serial(synthetic_data):
+    store.ingest_all()
+    actual = stream.summarize_years([2020, 2021], "county", statistics=["count", "mean", "max"])
+    for year in (2020, 2021):
+        suffix = f"{year % 100:02d}"
+        expected = serial_summary(load_table(f"tsal1{suffix}"), load_table(f"tsal2{suffix}"),
+                                  load_table(f"tsal3{suffix}"), "county", ["count", "mean", "max"])
+        summary = actual[actual["year"] == year].drop(columns="year").reset_index(drop=True)
+        pd.testing.assert_frame_equal(summary, expected, check_dtype=False, check_categorical=False)
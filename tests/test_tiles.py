@@ -0,0 +1,33 @@
+import re
+
+import folium
+import mapbox_vector_tile
+import pytest
+
+import pipeline
+from geometry import COUNTIES_SHP, DISTRICTS_SHP
+from tiles import vector_tile_layer
+
+
+def test_tile_layers_do_not_share_globals():
+    m = folium.Map()
+    m.add_child(vector_tile_layer("a/{z}/{x}/{y}.pbf", "county"))
+    m.add_child(vector_tile_layer("b/{z}/{x}/{y}.pbf", "district"))
+    html = m.get_root().render()
+    declared = re.findall(r"var (\w+) = L\.vectorGrid", html)
+    assert len(declared) == 2 and len(set(declared)) == 2
+    assert "salary_tiles" not in html and "var highlighted_id" not in html
+
+
+# mapbox-vector-tile still encodes through shapely.ops.transform
+@pytest.mark.filterwarnings("ignore:.*shapely.ops.transform:DeprecationWarning")
+def test_build_map_writes_the_tiles_it_loads(synthetic_data, tmp_path):
+    prepared = pipeline.load_prepared(COUNTIES_SHP, DISTRICTS_SHP)
+    out = tmp_path / "county.html"
+    pipeline.build_map(prepared, "county", 1, ["MA"], "Title", "Legend", out, tiles_dir=tmp_path / "tiles",
+                       shapefile=COUNTIES_SHP)
+    assert "tiles/county/{z}/{x}/{y}.pbf" in out.read_text()
+    pbfs = sorted((tmp_path / "tiles" / "county").rglob("*.pbf"))
+    assert pbfs
+    features = mapbox_vector_tile.decode(pbfs[0].read_bytes())["county"]["features"]
+    assert {"COUNTY_NUM", "salary", "salary_rank", "fill_color", "tooltip"} <= set(features[0]["properties"])